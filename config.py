@@ -1,9 +1,15 @@
 # vim:fileencoding=utf-8:foldmethod=marker
+# Times everything below when QTILE_PROFILE_CONFIG is set, see utils/profiler.py
+from utils.profiler import profile  # isort: skip
+
+profile.start()
+
+import time
+from datetime import datetime, timezone
 from os import environ, path
-from subprocess import Popen
 
-from libqtile import bar, extension, hook, qtile
-from libqtile.backend.wayland import InputConfig
+from libqtile import bar, hook, qtile
+from libqtile.command.base import expose_command
 from libqtile.config import DropDown, Group, Match, ScratchPad, Screen
 from libqtile.config import EzClick as Click
 from libqtile.config import EzDrag as Drag
@@ -12,14 +18,33 @@ from libqtile.config import EzKeyChord as KeyChord
 from libqtile.layout import Bsp, Columns, Floating, Max, Stack, Tile
 from libqtile.lazy import lazy
 from qtile_extras import widget
-from qtile_extras.widget.decorations import RectDecoration
 
-from utils.audio import get_active_audio_device
+from utils.audio import backend as audio
+from utils.audio import controller as volume_ctl
+from utils.autostart import Service, Supervisor, dbus_name, mounted, x_selection
+from utils.autoswitch import GroupSwitcher
+from utils.clock import seconds_until_change
+from utils.deferred import Deferred, DeferredExtension, Namespace
+from utils.desktop import Launcher
+from utils.refresh import lock_command, scheduler
+from utils.reload import IncrementalReload
+from utils.rules import WindowRouter
+from utils.runner import Runner
+from utils.scratchpad import Warm, WarmPool
+from utils.screenshot import screenshooter
+from utils.sysmetrics import sampler
+from utils.websearch import launch as launch_websearch
 
 # Variables {{{
 
+profile.section("Variables")
+
 home = path.expanduser("~")
 
+# Imported and built when a bar or key first needs them, see utils/deferred.py
+widgets = Namespace("qtile_extras.widget")
+extensions = Namespace("libqtile.extension", DeferredExtension)
+
 terminal = ""
 
 if qtile.core.name == "x11":
@@ -27,13 +52,13 @@ if qtile.core.name == "x11":
 elif qtile.core.name == "wayland":
     terminal = "foot"
 
-autostart_sh = home + "/.config/qtile/scripts/qtile_autostart"
+qtile_dir = home + "/.config/qtile"
+google_drive = home + "/Google Drive"
 color_picker = home + "/.config/qtile/scripts/qtile_colorpicker"
 network_manager = home + "/.config/qtile/scripts/networkmanager"
 websearch = home + "/.config/qtile/scripts/dmenu_websearch"
 download = home + "/.config/qtile/scripts/dmenu_downloader"
 volume = home + "/.config/qtile/scripts/qtile_volume"
-screenshot = home + "/.config/qtile/scripts/qtile_screenshot"
 file_manager = "nemo"
 tui_file_manager = home + "/.cargo/bin/yazi"
 web_browser = "firefox"
@@ -45,6 +70,8 @@ android_studio = "android-studio"
 upgrade_system = "paru -Syu"
 telegram = "telegram-desktop"
 password_manager = "keepassxc"
+# Leaves a pidfile, so the bar can tell the screen is locked
+lock_screen = lock_command("betterlockscreen --lock --time-format %H:%M")
 dmenu_applets = home + "/.config/qtile/scripts/"
 notify_cmd = "dunstify -u low -h string:x-dunst-stack-tag:qtileconfig"
 
@@ -75,31 +102,165 @@ colors = [
 # }}}
 # Environments {{{
 
+profile.section("Environments")
+
 environ["KITTY_CONFIG_DIRECTORY"] = home + "/.config/qtile/kitty"
 
 # }}}
 # Wayland Input Rules {{{
 
-wl_input_rules = {
-    "type:keyboard": InputConfig(
-        kb_layout="us,ru",
-        kb_options="grp:win_space_toggle",
-    ),
-}
+profile.section("Wayland Input Rules")
+
+if qtile.core.name == "wayland":
+    from libqtile.backend.wayland import InputConfig
+
+    wl_input_rules = {
+        "type:keyboard": InputConfig(
+            kb_layout="us,ru",
+            kb_options="grp:win_space_toggle",
+        ),
+    }
 
 
 # }}}
 # Autostart {{{
 
+profile.section("Autostart")
+
+
+supervisor = Supervisor(
+    [
+        Service(
+            "polkit",
+            ["/usr/lib/polkit-gnome/polkit-gnome-authentication-agent-1"],
+            unique=True,
+        ),
+        Service(
+            "xsettingsd",
+            ["xsettingsd", "--config=" + qtile_dir + "/xsettingsd"],
+            ready=x_selection("_XSETTINGS_S0"),
+            replace=True,
+            session="x11",
+        ),
+        Service(
+            "cursor",
+            ["xsetroot", "-cursor_name", "left_ptr"],
+            oneshot=True,
+            session="x11",
+        ),
+        Service(
+            "picom",
+            ["picom", "--config", qtile_dir + "/picom/picom.conf"],
+            ready=x_selection("_NET_WM_CM_S0"),
+            replace=True,
+            session="x11",
+        ),
+        Service(
+            "resolution",
+            ["wlr-randr", "--output=X11-1", "--custom-mode", "1920x1080"],
+            oneshot=True,
+            session="wayland",
+        ),
+        Service(
+            "dunst",
+            ["dunst", "-config", qtile_dir + "/dunstrc"],
+            ready=dbus_name("org.freedesktop.Notifications"),
+            replace=True,
+        ),
+        Service(
+            "rclone",
+            ["rclone", "mount", "--daemon", "GoogleDriveMain:", google_drive],
+            ready=mounted(google_drive),
+            oneshot=True,
+            timeout=30,
+        ),
+        # Reports its errors as notifications
+        Service("jamesdsp", ["jamesdsp", "-t"], after=["dunst"]),
+        # Serves the network menu, started cold when it isn't running
+        Service(
+            "networkmanager",
+            [network_manager, "--daemon"],
+            after=["dunst"],
+            replace=True,
+            # Menus open at the time run the same script, leave them be
+            match=["--daemon"],
+        ),
+    ]
+)
+
 
 @hook.subscribe.startup_once
 def autostart():
-    Popen([autostart_sh])
+    supervisor.start(qtile.core.name)
+
+
+# Also after a restart, dropdowns still running are kept as they are. After a
+# reload the new pool takes over from the old one, see utils/reload.py
+@hook.subscribe.startup
+@hook.subscribe.user("config_reloaded")
+def start_warm_pool():
+    warm_pool.start(qtile)
+
+
+# }}}
+# Audio {{{
+
+profile.section("Audio")
+
+
+volume_step = 5
+
+
+def change_volume(qtile, delta):
+    volume_ctl.change(delta)
+
+
+def toggle_mute(qtile):
+    volume_ctl.toggle_mute()
 
 
 # }}}
 # Key Bindings {{{
 
+profile.section("Key Bindings")
+
+
+def toggle_dropdown(qtile, name):
+    warm_pool.toggle(qtile, name)
+
+
+def take_screenshot(qtile, mode, delay=0):
+    screenshooter.shoot(qtile, mode, delay)
+
+
+def web_search(qtile):
+    launch_websearch(qtile, dmenu_applets + "dmenu_websearch")
+
+
+# Desktop entries indexed once and kept current by inotify, see utils/desktop.py
+app_launcher = Launcher(prompt="Apps ", dmenu="dmenu -vi", terminal=terminal)
+
+
+def launch_app(qtile):
+    app_launcher.show(qtile)
+
+
+# $PATH listed once and kept current by inotify, see utils/runner.py
+command_runner = Runner(prompt="󰜎 ", dmenu="dmenu -vi")
+
+
+def run_command(qtile):
+    command_runner.show(qtile)
+
+
+# Keeps the keys, groups and widgets that didn't change, see utils/reload.py
+incremental_reload = IncrementalReload(discard=scheduler.forget)
+
+
+def reload_config(qtile):
+    incremental_reload(qtile)
+
+
 keys = [
     # Apps --
     Key("M-<Return>", lazy.spawn(terminal), desc="Terminal"),
@@ -111,60 +272,53 @@ keys = [
     # Scratchpads --
     Key(
         "M-t",
-        lazy.group["scratchpad"].dropdown_toggle("Terminal"),
+        lazy.function(toggle_dropdown, "Terminal"),
         desc="Dropdown terminal",
     ),
-    Key("M-m", lazy.group["scratchpad"].dropdown_toggle("Telegram"), desc="Telegram"),
+    Key("M-m", lazy.function(toggle_dropdown, "Telegram"), desc="Telegram"),
     Key(
         "M-u",
-        lazy.group["scratchpad"].dropdown_toggle("Upgrade system"),
+        lazy.function(toggle_dropdown, "Upgrade system"),
         desc="Upgrade system",
     ),
     Key(
         "<XF86Tools>",
-        lazy.group["scratchpad"].dropdown_toggle("Music player"),
+        lazy.function(toggle_dropdown, "Music player"),
         desc="Music player",
     ),
     Key(
         "<XF86Mail>",
-        lazy.group["scratchpad"].dropdown_toggle("Email client"),
+        lazy.function(toggle_dropdown, "Email client"),
         desc="Email client",
     ),
     Key(
         "M-S-f",
-        lazy.group["scratchpad"].dropdown_toggle("File manager"),
+        lazy.function(toggle_dropdown, "File manager"),
         desc="File manager (TUI)",
     ),
     Key(
         "M-p",
-        lazy.group["scratchpad"].dropdown_toggle("Password manager"),
+        lazy.function(toggle_dropdown, "Password manager"),
         desc="Password manager",
     ),
     Key(
         "<XF86Calculator>",
-        lazy.group["scratchpad"].dropdown_toggle("Calculator"),
+        lazy.function(toggle_dropdown, "Calculator"),
         desc="Calculator",
     ),
     # Dmenu Applets --
     Key(
         "A-<F1>",
-        lazy.run_extension(
-            extension.J4DmenuDesktop(
-                dmenu_prompt="Apps ",
-                dmenu_command="dmenu -vi",
-                dmenu_ignorecase=True,
-                dmenu_lines=10,
-            )
-        ),
+        lazy.function(launch_app),
         desc="Application launcher applet",
     ),
     Key(
         "A-q",
         lazy.run_extension(
-            extension.CommandSet(
+            extensions.CommandSet(
                 dmenu_prompt="Session Manager",
                 commands={
-                    " Lock": "betterlockscreen --lock --time-format %H:%M",
+                    " Lock": lock_screen,
                     "󰍃 Logout": "qtile cmd-obj -o cmd -f shutdown",
                     " Reload": "qtile cmd-obj -o cmd -f restart",
                     " Reboot": "systemctl reboot",
@@ -179,7 +333,7 @@ keys = [
     Key(
         "A-w",
         lazy.run_extension(
-            extension.WindowList(
+            extensions.WindowList(
                 dmenu_prompt="Current open windows",
                 item_format="{group} {window}",
                 dmenu_command="dmenu -vi -noi",
@@ -191,7 +345,7 @@ keys = [
     Key(
         "A-r",
         lazy.run_extension(
-            extension.CommandSet(
+            extensions.CommandSet(
                 dmenu_prompt="Launch as root",
                 commands={
                     " Terminal": dmenu_applets + "qtile_asroot " + terminal,
@@ -218,14 +372,7 @@ keys = [
     ),
     Key(
         "M-r",
-        lazy.run_extension(
-            extension.DmenuRun(
-                dmenu_prompt="󰜎 ",
-                dmenu_command="dmenu_run -vi",
-                dmenu_ignorecase=True,
-                dmenu_lines=10,
-            )
-        ),
+        lazy.function(run_command),
         desc="Application runner applet",
     ),
     Key(
@@ -235,14 +382,14 @@ keys = [
     ),
     Key(
         "M-s",
-        lazy.spawn(dmenu_applets + "dmenu_websearch"),
         lazy.group["3"].toscreen(),
+        lazy.function(web_search),
         desc="Web search applet",
     ),
     Key(
         "A-n",
         lazy.run_extension(
-            extension.Dmenu(
+            extensions.Dmenu(
                 dmenu_command=network_manager,
             )
         ),
@@ -256,15 +403,15 @@ keys = [
     # Function keys : Volume --
     Key(
         "<XF86AudioRaiseVolume>",
-        lazy.spawn(volume + " --inc"),
+        lazy.function(change_volume, volume_step),
         desc="Raise speaker volume",
     ),
     Key(
         "<XF86AudioLowerVolume>",
-        lazy.spawn(volume + " --dec"),
+        lazy.function(change_volume, -volume_step),
         desc="Lower speaker volume",
     ),
-    Key("<XF86AudioMute>", lazy.spawn(volume + " --toggle"), desc="Toggle mute"),
+    Key("<XF86AudioMute>", lazy.function(toggle_mute), desc="Toggle mute"),
     # Function keys : Media --
     Key("<XF86AudioNext>", lazy.spawn("playerctl next"), desc="Next track"),
     Key("<XF86AudioPrev>", lazy.spawn("playerctl previous"), desc="Previous track"),
@@ -273,32 +420,32 @@ keys = [
     ),
     Key("<XF86AudioStop>", lazy.spawn("playerctl stop"), desc="Stop playing"),
     # Screenshots --
-    Key("<Print>", lazy.spawn(screenshot + " --now"), desc="Take Screenshot"),
+    Key("<Print>", lazy.function(take_screenshot, "screen"), desc="Take Screenshot"),
     Key(
         "C-<Print>",
-        lazy.spawn(screenshot + " --in5"),
+        lazy.function(take_screenshot, "screen", 5),
         desc="Take Screenshot in 5 seconds",
     ),
     Key(
         "S-<Print>",
-        lazy.spawn(screenshot + " --in10"),
+        lazy.function(take_screenshot, "screen", 10),
         desc="Take Screenshot in 10 seconds",
     ),
     Key(
         "C-S-<Print>",
-        lazy.spawn(screenshot + " --win"),
+        lazy.function(take_screenshot, "window"),
         desc="Take Screenshot of active window",
     ),
     Key(
         "M-<Print>",
-        lazy.spawn(screenshot + " --area"),
+        lazy.function(take_screenshot, "area"),
         desc="Take Screenshot of selected area",
     ),
     # Misc --
     Key("A-p", lazy.spawn(color_picker), desc="Run colorpicker"),
     Key(
         "A-C-l",
-        lazy.spawn("betterlockscreen --lock --time-format %H:%M"),
+        lazy.spawn(lock_screen),
         desc="Run lockscreen",
     ),
     # WM Specific --
@@ -306,8 +453,7 @@ keys = [
     # Control Qtile
     Key(
         "M-C-r",
-        lazy.reload_config(),
-        lazy.spawn(notify_cmd + ' "Configuration Reloaded!"'),
+        lazy.function(reload_config),
         desc="Reload the config",
     ),
     Key(
@@ -410,6 +556,8 @@ keys = [
 # }}}
 # Mouse Key Bindings {{{
 
+profile.section("Mouse Key Bindings")
+
 # Drag floating layouts.
 mouse = [
     Drag("M-1", lazy.window.set_position_floating(), start=lazy.window.get_position()),
@@ -421,12 +569,24 @@ mouse = [
 # }}}
 # Groups {{{
 
+profile.section("Groups")
+
+
+group_switcher = GroupSwitcher()
 
-# Auto-switching group when a new window is launched
+
+# Auto-switching group when a new window is launched, once per burst
 @hook.subscribe.client_managed
 def auto_switch(window):
-    if window.group.name != qtile.current_group.name:
-        window.group.cmd_toscreen()
+    group_switcher.client_managed(qtile, window)
+
+
+# Send new windows to their group, see router below
+@hook.subscribe.client_new
+def route_window(window):
+    name = router.group_for(window)
+    if name is not None:
+        window.togroup(name)
 
 
 groups = [
@@ -580,6 +740,19 @@ groups = [
     ),
 ]
 
+# Dropdowns started hidden after login, see utils/scratchpad.py. The budget is
+# the memory in MiB they may keep while parked before being closed when idle.
+warm_pool = WarmPool(
+    "scratchpad",
+    {
+        "Terminal": Warm(),
+        "Calculator": Warm(),
+        "Password manager": Warm(budget=200),
+        "Telegram": Warm(budget=500),
+        "Email client": Warm(budget=800, idle=3600),
+    },
+)
+
 for i in groups:
     if not isinstance(i, ScratchPad):
         keys.extend(
@@ -602,6 +775,8 @@ for i in groups:
 # }}}
 # Layouts {{{
 
+profile.section("Layouts")
+
 layouts = [
     # Extension of the Stack layout
     Columns(
@@ -680,24 +855,228 @@ layouts = [
 # }}}
 # Widgets {{{
 
+profile.section("Widgets")
+
 
 class CustomClock(widget.Clock):
+    defaults = [
+        (
+            "adaptive",
+            True,
+            "Sleep until the displayed text changes instead of polling.",
+        ),
+        ("poll_interval", 0.1, "Polling interval used when adaptive is False."),
+    ]
+
     def __init__(self, **config):
         widget.Clock.__init__(self, **config)
+        self.add_defaults(CustomClock.defaults)
         self.add_callbacks({"Button1": self.toggle_format})
         self.format_options = ["%I:%M", "%m/%d/%Y"]
         self.current_format_index = 0
-        self.update_interval = 0.1
+        self.update_interval = self.poll_interval
+        self.wakeups = 0
+        self._started = None
+        self._timer = None
+
+    def timer_setup(self):
+        if self._started is None:
+            self._started = time.monotonic()
+        self.wakeups += 1
+        self._timer = self.timeout_add(self.tick(), self.timer_setup)
+
+    def tick(self):
+        self.update(self.poll())
+        if not self.adaptive:
+            return self.poll_interval
+        # poll() renders DELTA ahead of the wall clock, so do the same here
+        # Naive local time without a timezone, astimezone() would fix the offset
+        if self.timezone is None:
+            now = datetime.now() + self.DELTA
+        else:
+            now = datetime.now(timezone.utc).astimezone(self.timezone) + self.DELTA
+        # Wake just after the boundary so the new value is already visible
+        return seconds_until_change(self.format, now) + 0.01
 
     def toggle_format(self):
         self.current_format_index = (self.current_format_index + 1) % len(
             self.format_options
         )
         self.format = self.format_options[self.current_format_index]
+        if self._timer is not None:
+            self._timer.cancel()
+        self.timer_setup()
+
+    @expose_command()
+    def wakeup_stats(self):
+        """Wakeups so far and how many polling at poll_interval would add"""
+        elapsed = time.monotonic() - self._started if self._started else 0
+        polled = int(elapsed / self.poll_interval)
+        return {
+            "wakeups": self.wakeups,
+            "avoided": max(polled - self.wakeups, 0),
+            "elapsed": elapsed,
+        }
+
+
+class SinkVolume(widget.Volume):
+    defaults = [
+        (
+            "push",
+            True,
+            "Redraw on sound server events instead of polling a command.",
+        ),
+    ]
+
+    def __init__(self, **config):
+        widget.Volume.__init__(self, **config)
+        self.add_defaults(SinkVolume.defaults)
+
+    def _configure(self, qtile, bar):
+        widget.Volume._configure(self, qtile, bar)
+        if self.push:
+            audio.add_listener(self.update)
+
+    def timer_setup(self):
+        if not self.push:
+            return widget.Volume.timer_setup(self)
+        # Sound server events call update, there's nothing to poll
+        self.update()
+
+    def finalize(self):
+        audio.remove_listener(self.update)
+        widget.Volume.finalize(self)
+
+    def get_volume(self):
+        if self.push:
+            if audio.volume is None:
+                return self.volume
+            return -1 if audio.muted else audio.volume
+        # Follow the cached default sink instead of the one seen at load time
+        self.get_volume_command = audio.volume_command()
+        return widget.Volume.get_volume(self)
+
+    @expose_command()
+    def increase_vol(self):
+        if not self.push:
+            return widget.Volume.increase_vol(self)
+        volume_ctl.change(self.step)
+
+    @expose_command()
+    def decrease_vol(self):
+        if not self.push:
+            return widget.Volume.decrease_vol(self)
+        volume_ctl.change(-self.step)
+
+    @expose_command()
+    def mute(self):
+        if not self.push:
+            return widget.Volume.mute(self)
+        volume_ctl.toggle_mute()
+
+    def update(self):
+        if not self.push:
+            return widget.Volume.update(self)
+        volume = self.get_volume()
+        if volume != self.volume:
+            self.volume = volume
+            self._update_drawer()
+            self.bar.draw()
+
+
+class SampledWidget:
+    """Feed a poll widget from the shared /proc sampler at its own interval"""
+
+    def timer_setup(self):
+        sampler.subscribe(self._sampled, self.update_interval)
+
+    def _sampled(self):
+        self.update(self.poll())
+
+    def interval_changed(self):
+        sampler.subscribe(self._sampled, self.update_interval)
+
+    def finalize(self):
+        sampler.unsubscribe(self._sampled)
+        super().finalize()
+
+
+class SampledCPU(SampledWidget, widget.CPU):
+    def poll(self):
+        load = sampler.cpu_percent(self.update_interval)
+        try:
+            return self.format.format(load_percent=round(load, 1))
+        except KeyError:
+            # Frequencies aren't sampled, let the widget read them itself
+            return widget.CPU.poll(self)
+
+
+class SampledMemory(SampledWidget, widget.Memory):
+    def poll(self):
+        mem = sampler.latest.mem
+        used = mem["MemTotal"] - mem["MemAvailable"]
+        swap_used = mem["SwapTotal"] - mem["SwapFree"]
+        val = {
+            "MemUsed": used / self.calc_mem,
+            "MemTotal": mem["MemTotal"] / self.calc_mem,
+            "MemFree": mem["MemFree"] / self.calc_mem,
+            "Buffers": mem["Buffers"] / self.calc_mem,
+            "Active": mem["Active"] / self.calc_mem,
+            "Inactive": mem["Inactive"] / self.calc_mem,
+            "Shmem": mem["Shmem"] / self.calc_mem,
+            "MemPercent": round(used / mem["MemTotal"] * 100, 1),
+            "SwapTotal": mem["SwapTotal"] / self.calc_swap,
+            "SwapFree": mem["SwapFree"] / self.calc_swap,
+            "SwapUsed": swap_used / self.calc_swap,
+            "SwapPercent": (
+                round(swap_used / mem["SwapTotal"] * 100, 1) if mem["SwapTotal"] else 0
+            ),
+            "mm": self.measure_mem,
+            "ms": self.measure_swap,
+        }
+        return self.format.format(**val)
+
+
+class SampledNet(SampledWidget, widget.Net):
+    def poll(self):
+        interfaces = self.interface
+        if not isinstance(interfaces, list):
+            interfaces = [interfaces]
+        ret = []
+        try:
+            for interface in interfaces:
+                name = None if interface in (None, "all") else interface
+                down, up = sampler.net_rates(name, self.update_interval)
+                down, down_suffix = self.convert_b(down)
+                total, total_suffix = self.convert_b(down + up)
+                up, up_suffix = self.convert_b(up)
+                ret.append(
+                    self.format.format(
+                        interface=interface,
+                        down=down,
+                        down_suffix=down_suffix,
+                        up=up,
+                        up_suffix=up_suffix,
+                        total=total,
+                        total_suffix=total_suffix,
+                    )
+                )
+        except KeyError:
+            # Cumulative counters aren't sampled, let the widget read them
+            return widget.Net.poll(self)
+        return " ".join(ret)
 
 
 decor = {
-    "decorations": [RectDecoration(colour=colors[16], radius=0, filled=True)],
+    "decorations": [
+        Deferred(
+            "qtile_extras.widget.decorations",
+            "RectDecoration",
+            colour=colors[16],
+            radius=0,
+            filled=True,
+        )
+    ],
     "padding": 20,
 }
 
@@ -709,13 +1088,13 @@ widget_defaults = dict(
     foreground=colors[0],
 )
 
-current_layout_icon = widget.CurrentLayoutIcon(
+current_layout_icon = widgets.CurrentLayoutIcon(
     scale=0.5,
     use_mask=True,
     foreground=colors[9],
     background=colors[1],
 )
-group_box = widget.GroupBox(
+group_box = widgets.GroupBox(
     fontsize=20,
     borderwidth=0,
     disable_drag=True,
@@ -731,22 +1110,23 @@ group_box = widget.GroupBox(
     urgent_text=colors[5],
     use_mouse_wheel=True,
 )
-windowname_icon = widget.TextBox(
+windowname_icon = widgets.TextBox(
     text="",
     fontsize=20,
     background=colors[9],
 )
-windowname = widget.WindowName(
+windowname = widgets.WindowName(
     scroll=True,
     width=300,
     foreground=colors[9],
 )
-cmus_icon = widget.TextBox(
+scheduler.policy(windowname, attrs=("scroll_interval",))
+cmus_icon = widgets.TextBox(
     text="",
     fontsize=20,
     background=colors[13],
 )
-cmus = widget.Cmus(
+cmus = widgets.Cmus(
     **decor,
     format="{play_icon}{artist} — {title}",
     scroll=True,
@@ -755,28 +1135,28 @@ cmus = widget.Cmus(
     play_color=colors[13],
     foreground=colors[13],
 )
-volume_icon = widget.TextBox(
+scheduler.policy(cmus, attrs=("update_interval", "scroll_interval"))
+volume_icon = widgets.TextBox(
     text="󰕾",
     fontsize=20,
     background=colors[9],
 )
-volume = widget.Volume(
-    get_volume_command=f"pactl get-sink-volume {get_active_audio_device()}",
+volume = SinkVolume(
     mute_command=volume + " --toggle",
     volume_app="pavucontrol",
     volume_down_command=volume + " --dec",
     volume_up_command=volume + " --inc",
     foreground=colors[9],
 )
-net_icon = widget.TextBox(
+net_icon = widgets.TextBox(
     text="",
     fontsize=22,
     background=colors[10],
 )
-net = widget.Net(
+net = SampledNet(
     mouse_callbacks={
         "Button1": lazy.run_extension(
-            extension.Dmenu(
+            extensions.Dmenu(
                 dmenu_command=network_manager,
             )
         ),
@@ -785,43 +1165,46 @@ net = widget.Net(
     update_interval=5,
     foreground=colors[10],
 )
-memory_icon = widget.TextBox(
+scheduler.policy(net, idle=6, locked=60, blanked=60)
+memory_icon = widgets.TextBox(
     text="",
     fontsize=20,
     background=colors[12],
 )
-memory = widget.Memory(
+memory = SampledMemory(
     format="{MemUsed:.0f}{mm}/{MemTotal:.0f}{mm}",
     measure_mem="G",
     foreground=colors[12],
 )
-cpu_icon = widget.TextBox(
+scheduler.policy(memory, idle=6, locked=60, blanked=60)
+cpu_icon = widgets.TextBox(
     text="󰍛",
     fontsize=20,
     background=colors[13],
 )
-cpu = widget.CPU(
+cpu = SampledCPU(
     format="{load_percent:.0f}%",
     update_interval=5,
     foreground=colors[13],
 )
-tray_icon = widget.TextBox(
+scheduler.policy(cpu, idle=6, locked=60, blanked=60)
+tray_icon = widgets.TextBox(
     text="",
     fontsize=20,
     background=colors[8],
 )
 tray = ""
 if qtile.core.name == "x11":
-    tray = widget.Systray(
+    tray = widgets.Systray(
         padding=5,
         icon_size=18,
     )
 elif qtile.core.name == "wayland":
-    tray = widget.StatusNotifier(
+    tray = widgets.StatusNotifier(
         padding=5,
         icon_size=18,
     )
-clock_icon = widget.TextBox(
+clock_icon = widgets.TextBox(
     text="",
     fontsize=20,
     background=colors[14],
@@ -830,10 +1213,14 @@ clock = CustomClock(
     format="%I:%M",
     foreground=colors[14],
 )
+# Already sleeps until its text changes, only count its wakeups
+scheduler.policy(clock, attrs=())
 
 # }}}
 # Extensions {{{
 
+profile.section("Extensions")
+
 extension_defaults = dict(
     font=font_name,
     fontsize=16,
@@ -846,19 +1233,52 @@ extension_defaults = dict(
 # }}}
 # Screens {{{
 
+profile.section("Screens")
+
+
+class BatchedBar(bar.Bar):
+    def _configure(self, qtile, screen, *args, **kwargs):
+        self.widgets = [
+            profile.build(w) if isinstance(w, Deferred) else w for w in self.widgets
+        ]
+        profile.amend()
+        bar.Bar._configure(self, qtile, screen, *args, **kwargs)
+        scheduler.start(qtile)
+
+    def draw(self):
+        if not self.widgets:
+            return
+        if not self._draw_queued:
+            # Wait for the next frame so that redraws requested by several
+            # widgets in the meantime are drawn together
+            self.future = self.qtile.call_later(
+                scheduler.frame_delay(), self._actual_draw
+            )
+            self._draw_queued = True
+
+    def _actual_draw(self):
+        scheduler.drawn()
+        bar.Bar._actual_draw(self)
+
+    @expose_command()
+    def refresh_stats(self):
+        """Wakeups in the last minute, bar draws and the session state"""
+        return scheduler.stats()
+
+
 screens = [
     Screen(
-        top=bar.Bar(
+        top=BatchedBar(
             [
                 current_layout_icon,
                 group_box,
                 windowname_icon,
                 windowname,
-                widget.Spacer(length=bar.STRETCH),
+                widgets.Spacer(length=bar.STRETCH),
                 cmus,
-                widget.Spacer(length=bar.STRETCH),
+                widgets.Spacer(length=bar.STRETCH),
                 tray,
-                widget.Spacer(length=5),
+                widgets.Spacer(length=5),
                 volume_icon,
                 volume,
                 net_icon,
@@ -888,6 +1308,8 @@ screens = [
 # }}}
 # General Configuration Variables {{{
 
+profile.section("General Configuration Variables")
+
 # If a window requests to be fullscreen, it is automatically fullscreened.
 # Set this to false if you only want windows to be fullscreen if you ask them to be.
 auto_fullscreen = True
@@ -907,8 +1329,14 @@ dgroups_key_binder = None
 # A list of Rule objects which can send windows to various groups based on matching criteria.
 dgroups_app_rules = []  # type: list
 
+
+class IndexedFloating(Floating):
+    def match(self, win):
+        return router.floating(win)
+
+
 # The default floating layout to use. This allows you to set custom floating rules among other things if you wish.
-floating_layout = Floating(
+floating_layout = IndexedFloating(
     border_focus=colors[9],
     border_normal=colors[0],
     border_width=border_width,
@@ -920,6 +1348,13 @@ floating_layout = Floating(
     ],
 )
 
+# Classify new windows with one index built from the group matches and float
+# rules, instead of qtile trying each Match in turn. The groups keep no
+# matches of their own so that windows are only routed once.
+router = WindowRouter(groups, floating_layout.float_rules)
+for group in groups:
+    group.matches = []
+
 # Behavior of the _NET_ACTIVATE_WINDOW message sent by applications
 #
 # urgent: urgent flag is set for the window
@@ -952,3 +1387,5 @@ wmname = "Qtile"
 wl_input_rules = None
 
 # }}}
+
+profile.finish()
@@ -0,0 +1,423 @@
+"""In-memory stand-ins for the NetworkManager objects networkmanager uses.
+
+They implement just the calls the script makes, so the menu can be built,
+used and timed without NetworkManager or the gi bindings. Asynchronous calls
+complete from the fake main loop, the way NM's callbacks would.
+"""
+
+import enum
+import heapq
+import itertools
+import random
+from collections import deque
+
+
+class _ApFlags(enum.IntFlag):
+    NONE = 0
+    PRIVACY = 1
+
+
+class _ApSecurityFlags(enum.IntFlag):
+    NONE = 0
+    KEY_MGMT_PSK = 0x100
+    KEY_MGMT_802_1X = 0x200
+    KEY_MGMT_SAE = 0x400
+    KEY_MGMT_OWE = 0x800
+
+
+class _DeviceType(enum.IntEnum):
+    ETHERNET = 1
+    WIFI = 2
+
+
+class _IOCondition(enum.IntFlag):
+    IN = 1
+
+
+class FakeGLib:
+    """The parts of ``GLib`` the script uses, over one in-process queue.
+
+    Timeouts don't wait, they fire once nothing else is pending, in order.
+    """
+
+    PRIORITY_DEFAULT = 0
+    IOCondition = _IOCondition
+    _ids = itertools.count(1)
+    _ready = deque()
+    _timers = []
+    _removed = set()
+
+    class Error(Exception):
+        code = 0
+
+    class MainLoop:
+        def __init__(self):
+            self.running = False
+
+        def run(self):
+            self.running = True
+            while self.running:
+                source = FakeGLib.next_source()
+                if source is None:
+                    # A real loop would wait forever
+                    break
+                func, args = source
+                # Sources run once, whatever they return
+                func(*args)
+            self.running = False
+
+        def quit(self):
+            self.running = False
+
+    @classmethod
+    def idle_add(cls, func, *args):
+        source = next(cls._ids)
+        cls._ready.append((source, func, args))
+        return source
+
+    @classmethod
+    def timeout_add_seconds(cls, seconds, func, *args):
+        source = next(cls._ids)
+        heapq.heappush(cls._timers, (seconds, source, func, args))
+        return source
+
+    @classmethod
+    def source_remove(cls, source):
+        cls._removed.add(source)
+
+    @classmethod
+    def next_source(cls):
+        while cls._ready or cls._timers:
+            if cls._ready:
+                source, func, args = cls._ready.popleft()
+            else:
+                _, source, func, args = heapq.heappop(cls._timers)
+            if source in cls._removed:
+                cls._removed.discard(source)
+                continue
+            return func, args
+        return None
+
+
+class _Object:
+    """Signal handling of a GObject"""
+
+    _handler_ids = itertools.count(1)
+
+    def __init__(self):
+        self._handlers = {}
+
+    def connect(self, signal, callback, *data):
+        handler = next(self._handler_ids)
+        self._handlers[handler] = (signal, callback, data)
+        return handler
+
+    def disconnect(self, handler):
+        self._handlers.pop(handler, None)
+
+    def emit(self, signal, *args):
+        for name, callback, data in list(self._handlers.values()):
+            if name == signal:
+                callback(self, *args, *data)
+
+
+class Bytes:
+    def __init__(self, data):
+        self.data = data
+
+    def get_data(self):
+        return self.data
+
+
+class SettingWireless:
+    def __init__(self, ssid, mac=None):
+        self.ssid = ssid
+        self.mac = mac
+
+    def get_ssid(self):
+        return Bytes(self.ssid)
+
+    def get_mac_address(self):
+        return self.mac
+
+
+class SettingConnection:
+    def __init__(self, interface=None):
+        self.interface = interface
+
+    def get_interface_name(self):
+        return self.interface
+
+
+class Connection:
+    def __init__(self, name, kind, ssid=None, interface=None):
+        self.name = name
+        self.kind = kind
+        self.wireless = SettingWireless(ssid) if ssid is not None else None
+        self.connection = SettingConnection(interface)
+        self.client = None
+
+    def get_id(self):
+        return self.name
+
+    def is_type(self, kind):
+        return self.kind == kind
+
+    def get_setting_wireless(self):
+        return self.wireless
+
+    def get_setting_connection(self):
+        return self.connection
+
+    def delete_async(self, cancellable, callback, data):
+        self.client.remove_connection(self)
+        if callback is not None:
+            FakeGLib.idle_add(callback, self, True, data)
+
+    def delete_finish(self, result):
+        return result
+
+
+class ActiveConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_id(self):
+        return self.connection.get_id()
+
+    def get_connection(self):
+        return self.connection
+
+    def get_connection_type(self):
+        return self.connection.kind
+
+    def get_vpn(self):
+        return self.connection.kind == FakeNM.SETTING_VPN_SETTING_NAME
+
+
+class AccessPoint:
+    def __init__(self, ssid, bssid, strength, rsn_flags=0):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.strength = strength
+        self.rsn_flags = rsn_flags
+
+    def get_ssid(self):
+        return Bytes(self.ssid)
+
+    def get_bssid(self):
+        return self.bssid
+
+    def get_strength(self):
+        return self.strength
+
+    def get_flags(self):
+        return _ApFlags.PRIVACY if self.rsn_flags else _ApFlags.NONE
+
+    def get_wpa_flags(self):
+        return 0
+
+    def get_rsn_flags(self):
+        return self.rsn_flags
+
+    def get_path(self):
+        return f"/org/freedesktop/NetworkManager/AccessPoint/{self.bssid}"
+
+    def filter_connections(self, connections):
+        return [
+            conn
+            for conn in connections
+            if conn.get_setting_wireless() is not None
+            and conn.get_setting_wireless().ssid == self.ssid
+        ]
+
+
+class Device(_Object):
+    def __init__(self, iface, device_type):
+        super().__init__()
+        self.iface = iface
+        self.device_type = device_type
+
+    def get_iface(self):
+        return self.iface
+
+    def get_permanent_hw_address(self):
+        return "00:00:00:00:00:01"
+
+    def get_device_type(self):
+        return self.device_type
+
+
+class WifiDevice(Device):
+    def __init__(self, iface, access_points, active=None):
+        super().__init__(iface, _DeviceType.WIFI)
+        self.access_points = access_points
+        self.active = active
+
+    def get_access_points(self):
+        return self.access_points
+
+    def get_active_access_point(self):
+        return self.active
+
+    def request_scan_async(self, cancellable, callback, data):
+        FakeGLib.idle_add(callback, self, True, data)
+        FakeGLib.idle_add(self.emit, "notify::last-scan", None)
+
+    def request_scan_finish(self, result):
+        return result
+
+
+class Client(_Object):
+    """An ``NM.Client`` over fixed devices and connections.
+
+    Activating and deactivating connections completes from the main loop,
+    emitting the signals NM would.
+    """
+
+    # The keyword arguments of client_fixture() used by new()
+    fixture = {}
+
+    def __init__(self, devices, connections, active=()):
+        super().__init__()
+        self.devices = devices
+        self.connections = list(connections)
+        self.active = list(active)
+        self.enabled = {"networking": True, "wireless": True, "wwan": True}
+        for conn in self.connections:
+            conn.client = self
+
+    @classmethod
+    def new(cls, cancellable):
+        return client_fixture(**cls.fixture)
+
+    def get_devices(self):
+        return self.devices
+
+    def get_connections(self):
+        return list(self.connections)
+
+    def get_active_connections(self):
+        return list(self.active)
+
+    def networking_get_enabled(self):
+        return self.enabled["networking"]
+
+    def wireless_get_enabled(self):
+        return self.enabled["wireless"]
+
+    def wwan_get_enabled(self):
+        return self.enabled["wwan"]
+
+    def remove_connection(self, conn):
+        self.connections.remove(conn)
+        self.emit("connection-removed", conn)
+
+    def activate_connection_async(
+        self, conn, device, specific_object, cancellable, callback, data
+    ):
+        def complete():
+            active = ActiveConnection(conn)
+            self.active.append(active)
+            self.emit("notify::active-connections", None)
+            callback(self, active, data)
+
+        FakeGLib.idle_add(complete)
+
+    def activate_connection_finish(self, result):
+        return result
+
+    def deactivate_connection_async(self, active, cancellable, callback, data):
+        def complete():
+            self.active = [a for a in self.active if a.get_id() != active.get_id()]
+            self.emit("notify::active-connections", None)
+            callback(self, True, data)
+
+        FakeGLib.idle_add(complete)
+
+    def deactivate_connection_finish(self, result):
+        return result
+
+
+class FakeNM:
+    """The parts of the ``NM`` namespace the script uses"""
+
+    Client = Client
+    DeviceType = _DeviceType
+    DeviceWifi = WifiDevice
+    SETTING_BLUETOOTH_SETTING_NAME = "bluetooth"
+    SETTING_GSM_SETTING_NAME = "gsm"
+    SETTING_VLAN_SETTING_NAME = "vlan"
+    SETTING_VPN_SETTING_NAME = "vpn"
+    SETTING_WIRED_SETTING_NAME = "802-3-ethernet"
+    SETTING_WIREGUARD_SETTING_NAME = "wireguard"
+    SETTING_WIRELESS_SETTING_NAME = "802-11-wireless"
+
+    @staticmethod
+    def utils_ssid_to_utf8(data):
+        return bytes(data).decode("utf-8", "replace")
+
+    @staticmethod
+    def utils_wifi_strength_bars(strength):
+        bars = min(4, (strength + 4) // 20)
+        return "*" * bars + "_" * (4 - bars)
+
+
+setattr(FakeNM, "80211ApFlags", _ApFlags)
+setattr(FakeNM, "80211ApSecurityFlags", _ApSecurityFlags)
+
+
+def wifi_fixture(bssids, ssids, saved, seed=0):
+    """A device seeing ``bssids`` access points spread over ``ssids`` networks.
+
+    ``saved`` of the networks have a connection profile, and the first of
+    them is the active one. Returns the device, the connections and the
+    active connections.
+    """
+    rng = random.Random(seed)
+    names = [f"network-{i}".encode() for i in range(ssids)]
+    access_points = [
+        AccessPoint(
+            names[i % ssids],
+            f"02:00:00:{i >> 16 & 255:02X}:{i >> 8 & 255:02X}:{i & 255:02X}",
+            rng.randint(5, 100),
+            rng.choice((0, _ApSecurityFlags.KEY_MGMT_PSK)),
+        )
+        for i in range(bssids)
+    ]
+    connections = [
+        Connection(name.decode(), FakeNM.SETTING_WIRELESS_SETTING_NAME, ssid=name)
+        for name in names[:saved]
+    ]
+    active = []
+    device = WifiDevice("wlan0", access_points)
+    if connections:
+        device.active = access_points[0]
+        active.append(ActiveConnection(connections[0]))
+    return device, connections, active
+
+
+def client_fixture(connections=40, bssids=60, ssids=30, seed=0):
+    """A client with a wired and a Wi-Fi device and ``connections`` profiles.
+
+    A quarter of the networks have a Wi-Fi profile; the other profiles are
+    spread over wired, VLAN, VPN, WireGuard, GSM and Bluetooth, and one of
+    each kind is active.
+    """
+    device, wifi, active = wifi_fixture(bssids, ssids, ssids // 4, seed)
+    kinds = [
+        FakeNM.SETTING_WIRED_SETTING_NAME,
+        FakeNM.SETTING_VLAN_SETTING_NAME,
+        FakeNM.SETTING_VPN_SETTING_NAME,
+        FakeNM.SETTING_WIREGUARD_SETTING_NAME,
+        FakeNM.SETTING_GSM_SETTING_NAME,
+        FakeNM.SETTING_BLUETOOTH_SETTING_NAME,
+    ]
+    count = max(connections - len(wifi), 0)
+    others = [
+        Connection(f"{kind}-{i}", kind)
+        for i, kind in zip(range(count), itertools.cycle(kinds))
+    ]
+    active += [ActiveConnection(conn) for conn in others[: len(kinds)]]
+    devices = [Device("eth0", _DeviceType.ETHERNET), device]
+    return Client(devices, wifi + others, active)
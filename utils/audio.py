@@ -1,7 +1,448 @@
+import asyncio
+import json
+import re
+import shlex
+import shutil
 import subprocess
+import time
+from asyncio.subprocess import DEVNULL, PIPE
+from os import path
+
+from utils.notify import notifier
+
+try:
+    import pulsectl
+    import pulsectl_asyncio
+
+    PULSE_ERRORS = (pulsectl.PulseError, pulsectl.PulseDisconnected)
+    has_pulsectl = True
+except (ImportError, OSError):
+    # pulsectl raises OSError when libpulse itself is missing
+    has_pulsectl = False
+
+PACTL = "pactl"
+FALLBACK_SINK = "@DEFAULT_SINK@"
+RESUBSCRIBE_DELAY = 1
+# Key repeats arriving within this many seconds are applied as one change
+COALESCE_WINDOW = 0.05
+VOLUME_LIMIT = 100
+ICON_DIR = "/usr/share/archcraft/icons/dunst"
+# How long the benchmark waits for the sound server to report a change
+MEASURE_TIMEOUT = 2
+
+_event_re = re.compile(r"Event '(?P<kind>\w+)' on (?P<facility>[\w-]+) #(?P<index>\d+)")
+
+
+async def _pactl(*args):
+    proc = await asyncio.create_subprocess_exec(
+        PACTL, *args, stdout=PIPE, stderr=DEVNULL
+    )
+    output, _ = await proc.communicate()
+    return output.decode().strip() if proc.returncode == 0 else None
+
+
+class PactlServer:
+    """PulseAudio or pipewire-pulse, reached through pactl"""
+
+    async def default_sink(self):
+        return await _pactl("get-default-sink")
+
+    async def sink_state(self, sink):
+        """Return ``(volume, muted)`` of ``sink``, volume in percent"""
+        output = await _pactl("--format=json", "list", "sinks")
+        if output is None:
+            return None, None
+        for info in json.loads(output):
+            if info["name"] == sink:
+                channels = [
+                    int(channel["value_percent"].rstrip("%"))
+                    for channel in info["volume"].values()
+                ]
+                volume = round(sum(channels) / len(channels)) if channels else 0
+                return volume, info["mute"]
+        return None, None
+
+    async def set_volume(self, sink, volume):
+        await _pactl("set-sink-volume", sink, f"{volume}%")
+
+    async def set_mute(self, sink, muted):
+        await _pactl("set-sink-mute", sink, "1" if muted else "0")
+
+    async def events(self):
+        """Yield ``(kind, facility)`` for every event the server reports"""
+        proc = await asyncio.create_subprocess_exec(
+            PACTL, "subscribe", stdout=PIPE, stderr=DEVNULL
+        )
+        try:
+            async for line in proc.stdout:
+                event = _event_re.match(line.decode())
+                if event:
+                    yield event["kind"], event["facility"]
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+
+
+class PulseServer(PactlServer):
+    """The sound server through one libpulse connection, kept open.
+
+    Reads and writes go over the connection instead of a pactl process
+    each, events still come from ``pactl subscribe``. When the connection
+    fails it is dropped, the call falls back to pactl and the next one
+    connects again.
+    """
+
+    def __init__(self):
+        self._pulse = None
+
+    async def _connection(self):
+        if self._pulse is None:
+            pulse = pulsectl_asyncio.PulseAsync("qtile")
+            await pulse.connect()
+            self._pulse = pulse
+        return self._pulse
+
+    def _disconnect(self):
+        if self._pulse is not None:
+            self._pulse.close()
+            self._pulse = None
+
+    async def default_sink(self):
+        try:
+            pulse = await self._connection()
+            return (await pulse.server_info()).default_sink_name
+        except PULSE_ERRORS:
+            self._disconnect()
+            return await PactlServer.default_sink(self)
+
+    async def sink_state(self, sink):
+        try:
+            pulse = await self._connection()
+            info = await pulse.get_sink_by_name(sink)
+        except PULSE_ERRORS:
+            self._disconnect()
+            return await PactlServer.sink_state(self, sink)
+        return round(info.volume.value_flat * 100), bool(info.mute)
+
+    async def set_volume(self, sink, volume):
+        try:
+            pulse = await self._connection()
+            info = await pulse.get_sink_by_name(sink)
+            await pulse.volume_set_all_chans(info, volume / 100)
+        except PULSE_ERRORS:
+            self._disconnect()
+            await PactlServer.set_volume(self, sink, volume)
+
+    async def set_mute(self, sink, muted):
+        try:
+            pulse = await self._connection()
+            info = await pulse.get_sink_by_name(sink)
+            await pulse.mute(info, muted)
+        except PULSE_ERRORS:
+            self._disconnect()
+            await PactlServer.set_mute(self, sink, muted)
+
+
+class ScriptedServer:
+    """In-memory stand-in for the sound server.
+
+    Changes made through its setters are reported as events, the same way the
+    real server reports them, so the backend can be driven without audio.
+    """
+
+    def __init__(self, sinks, default):
+        self.sinks = {name: list(state) for name, state in sinks.items()}
+        self.default = default
+        self.writes = 0
+        self._events = asyncio.Queue()
+
+    async def set_volume(self, sink, volume):
+        self.sinks[sink][0] = volume
+        self.writes += 1
+        self._events.put_nowait(("change", "sink"))
+
+    async def set_mute(self, sink, muted):
+        self.sinks[sink][1] = muted
+        self.writes += 1
+        self._events.put_nowait(("change", "sink"))
+
+    def set_default(self, sink):
+        self.default = sink
+        self._events.put_nowait(("change", "server"))
+
+    async def default_sink(self):
+        return self.default
+
+    async def sink_state(self, sink):
+        volume, muted = self.sinks.get(sink, (None, None))
+        return volume, muted
+
+    async def events(self):
+        while True:
+            yield await self._events.get()
+
+
+class AudioBackend:
+    """Cache of the sound server state that never blocks its readers.
+
+    The default sink, its volume and mute state are resolved in the background
+    on the running event loop, then kept current from a single event
+    subscription. Bursts of events are coalesced into one refresh, after which
+    listeners are called. Until the first resolution finishes, readers get the
+    ``@DEFAULT_SINK@`` alias, which pactl resolves by itself.
+    """
+
+    def __init__(self, server=None):
+        self.server = server or (PulseServer() if has_pulsectl else PactlServer())
+        self.default_sink = None
+        self.volume = None
+        self.muted = None
+        self._listeners = []
+        self._task = None
+        self._refresh_task = None
+        self._dirty = False
+        self._sink_dirty = False
+
+    @property
+    def sink(self):
+        self.start()
+        return self.default_sink or FALLBACK_SINK
+
+    def start(self):
+        """Start the subscription if it isn't running and a loop is available"""
+        if self._task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        for task in (self._task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+        self._task = self._refresh_task = None
+
+    def add_listener(self, callback):
+        """Call ``callback()`` whenever the cached state changes"""
+        self._listeners.append(callback)
+        self.start()
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    async def refresh(self, sink=True):
+        previous = (self.default_sink, self.volume, self.muted)
+        if sink or self.default_sink is None:
+            self.default_sink = await self.server.default_sink()
+        self.volume, self.muted = await self.server.sink_state(self.sink)
+        if (self.default_sink, self.volume, self.muted) != previous:
+            for callback in list(self._listeners):
+                callback()
+
+    def invalidate(self, sink=False):
+        self._dirty = True
+        self._sink_dirty |= sink
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(
+                self._refresh_pending()
+            )
+
+    async def _refresh_pending(self):
+        while self._dirty:
+            sink, self._dirty, self._sink_dirty = self._sink_dirty, False, False
+            await self.refresh(sink)
+
+    async def _run(self):
+        while True:
+            self.invalidate(sink=True)
+            async for kind, facility in self.server.events():
+                if facility == "server":
+                    # The default sink is a server property
+                    self.invalidate(sink=True)
+                elif facility == "sink" and kind == "change":
+                    self.invalidate()
+            # The sound server went away, forget what we knew and retry
+            self.default_sink = self.volume = self.muted = None
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def volume_command(self):
+        return f"{PACTL} get-sink-volume {shlex.quote(self.sink)}"
+
+
+class VolumeController:
+    """Change the default sink's volume without a process per key press.
+
+    The current state comes from the backend's cache. Changes requested while
+    one is being applied are summed and applied together once
+    ``COALESCE_WINDOW`` has passed, so holding a key down costs at most one
+    write per window. The volume is clamped to ``VOLUME_LIMIT`` percent, and
+    each applied change updates a single notification in place.
+    """
+
+    def __init__(self, audio, notify=True):
+        self.audio = audio
+        self.notify = notify
+        self._pending = 0
+        self._target = None
+        self._task = None
+
+    def change(self, delta):
+        """Raise or lower the volume by ``delta`` percent and unmute"""
+        self._pending += delta
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._apply())
+        return self._task
+
+    async def _apply(self):
+        try:
+            while self._pending:
+                base = self._target
+                if base is None:
+                    base = self.audio.volume
+                if base is None:
+                    await self.audio.refresh()
+                    base = self.audio.volume or 0
+                target = min(max(base + self._pending, 0), VOLUME_LIMIT)
+                self._pending = 0
+                sink = self.audio.sink
+                if self.audio.muted:
+                    await self.audio.server.set_mute(sink, False)
+                await self.audio.server.set_volume(sink, target)
+                self._target = target
+                self._notify_volume(target)
+                await asyncio.sleep(COALESCE_WINDOW)
+        finally:
+            self._target = None
+
+    def toggle_mute(self):
+        muted = not self.audio.muted
+        task = asyncio.get_running_loop().create_task(
+            self.audio.server.set_mute(self.audio.sink, muted)
+        )
+        if self.notify:
+            volume = 0 if muted else self.audio.volume or 0
+            summary = "Mute" if muted else "Unmute"
+            notifier.notify(summary, icon=volume_icon(volume), tag="obvolume")
+        return task
+
+    def _notify_volume(self, volume):
+        if self.notify:
+            notifier.notify(
+                f"Volume : {volume}%",
+                icon=volume_icon(volume),
+                tag="obvolume",
+                value=volume,
+            )
+
+
+def volume_icon(volume):
+    if volume == 0:
+        name = "volume-mute"
+    elif volume <= 30:
+        name = "volume-low"
+    elif volume <= 60:
+        name = "volume-mid"
+    else:
+        name = "volume-high"
+    return path.join(ICON_DIR, name + ".png")
+
+
+backend = AudioBackend()
+controller = VolumeController(backend)
 
 
 def get_active_audio_device():
-    output = subprocess.check_output(["pactl", "get-default-sink"])
-    device = output.decode().strip()
-    return device
+    return backend.sink
+
+
+async def _measure_events(rounds):
+    server = ScriptedServer(
+        {"speakers": [50, False], "hdmi": [20, False]}, default="speakers"
+    )
+    audio = AudioBackend(server)
+    changed = asyncio.Event()
+    audio.add_listener(changed.set)
+    await changed.wait()
+    samples = []
+    for i in range(rounds):
+        changed.clear()
+        start = time.perf_counter()
+        await server.set_volume("speakers", i % 100)
+        await changed.wait()
+        samples.append(time.perf_counter() - start)
+    changed.clear()
+    server.set_default("hdmi")
+    await changed.wait()
+    assert audio.default_sink == "hdmi" and audio.volume == 20
+    audio.stop()
+    return samples
+
+
+async def _measure_keys(server, presses, interval):
+    """Time key press to applied volume, and count writes for a held key"""
+    audio = AudioBackend(server)
+    applied = asyncio.Event()
+    audio.add_listener(applied.set)
+    await asyncio.wait_for(applied.wait(), MEASURE_TIMEOUT)
+    ctl = VolumeController(audio, notify=False)
+    applied.clear()
+    # At 0 a decrement changes nothing and no event would come
+    step = 5 if (audio.volume or 0) < 5 else -5
+    start = time.perf_counter()
+    task = ctl.change(step)
+    await asyncio.wait_for(applied.wait(), MEASURE_TIMEOUT)
+    single = time.perf_counter() - start
+    await task
+    writes = getattr(server, "writes", 0)
+    start = time.perf_counter()
+    for _ in range(presses):
+        task = ctl.change(1)
+        await asyncio.sleep(interval)
+    await task
+    held = time.perf_counter() - start
+    writes = getattr(server, "writes", 0) - writes
+    await ctl.change(-step - presses)
+    return single, held, writes
+
+
+def _time_script(*args):
+    start = time.perf_counter()
+    subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    samples = sorted(asyncio.run(_measure_events(1000)))
+    print(
+        f"event to listener: median {samples[len(samples) // 2] * 1e6:.0f}us, "
+        f"max {samples[-1] * 1e6:.0f}us over {len(samples)} events"
+    )
+    server = ScriptedServer({"speakers": [50, False]}, default="speakers")
+    single, held, writes = asyncio.run(_measure_keys(server, 30, 0.03))
+    print(
+        f"controller (scripted): {single * 1e3:.2f}ms per press, "
+        f"30 repeats over {held * 1e3:.0f}ms applied in {writes} writes"
+    )
+    if shutil.which(PACTL):
+        servers = {"pactl": PactlServer}
+        if has_pulsectl:
+            servers["libpulse"] = PulseServer
+        for name, server in servers.items():
+            try:
+                single, held, _ = asyncio.run(_measure_keys(server(), 30, 0.03))
+            except TimeoutError:
+                print(f"controller ({name}): no change event, skipped")
+                continue
+            print(f"controller ({name}): {single * 1e3:.2f}ms per press")
+    else:
+        print("controller (pactl): skipped, pactl not found")
+    script = path.join(path.dirname(__file__), "..", "scripts", "qtile_volume")
+    if shutil.which("wpctl"):
+        elapsed = _time_script(script, "--dec") + _time_script(script, "--inc")
+        print(f"qtile_volume script: {elapsed / 2 * 1e3:.2f}ms per press")
+    else:
+        print("qtile_volume script: skipped, wpctl not found")
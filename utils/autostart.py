@@ -0,0 +1,260 @@
+import asyncio
+import os
+import signal
+import time
+from asyncio.subprocess import DEVNULL
+
+from libqtile.log_utils import logger
+
+try:
+    from dbus_next import Message
+    from dbus_next.aio import MessageBus
+
+    has_dbus = True
+except ImportError:
+    has_dbus = False
+
+try:
+    import xcffib
+    import xcffib.xproto
+
+    has_xcb = True
+except ImportError:
+    has_xcb = False
+
+# How often readiness is checked, in seconds
+POLL = 0.05
+BACKOFF_START = 1
+BACKOFF_MAX = 60
+# A service that ran this long before dying starts over with the shortest backoff
+STABLE_AFTER = 30
+
+
+def pids_of(command, match=()):
+    """Return the pids of processes running ``command[0]``.
+
+    A process matches when its argv[0] has the same base name, or, for
+    scripts run through their interpreter's shebang, when its argv[1] is
+    the same path, and when its arguments include all of ``match``.
+    """
+    program = command[0]
+    name = os.path.basename(program)
+    pids = []
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/cmdline", "rb") as f:
+                argv = os.fsdecode(f.read()).split("\0")
+        except OSError:
+            continue
+        if os.path.basename(argv[0]) == name or (
+            "/" in program and argv[1:2] == [program]
+        ):
+            if set(match) <= set(argv[1:]):
+                pids.append(int(entry.name))
+    return pids
+
+
+def dbus_name(name):
+    """Ready once ``name`` is owned on the session bus"""
+    bus = None
+
+    async def check():
+        nonlocal bus
+        if not has_dbus:
+            return True
+        if bus is None or not bus.connected:
+            bus = await MessageBus().connect()
+        reply = await bus.call(
+            Message(
+                destination="org.freedesktop.DBus",
+                path="/org/freedesktop/DBus",
+                interface="org.freedesktop.DBus",
+                member="NameHasOwner",
+                signature="s",
+                body=[name],
+            )
+        )
+        return bool(reply.body and reply.body[0])
+
+    return check
+
+
+def x_selection(atom):
+    """Ready once the X selection ``atom`` has an owner, e.g. a compositor"""
+    conn = None
+
+    async def check():
+        nonlocal conn
+        if not has_xcb:
+            return True
+        if conn is None:
+            conn = xcffib.connect()
+        xproto = conn(xcffib.xproto.key)
+        atom_id = xproto.InternAtom(False, len(atom), atom).reply().atom
+        return xproto.GetSelectionOwner(atom_id).reply().owner != 0
+
+    return check
+
+
+def mounted(path):
+    """Ready once something is mounted on ``path``"""
+    target = os.path.realpath(path).replace(" ", "\\040")
+
+    async def check():
+        with open("/proc/self/mountinfo") as f:
+            return any(line.split()[4] == target for line in f)
+
+    return check
+
+
+class Service:
+    """A program started with the session.
+
+    ``after`` names services that must be ready first. A service is ready
+    when ``ready``, an async predicate, returns True, or as soon as it's
+    running if there is none; a ``oneshot`` service must exit successfully
+    first, the way ``rclone mount --daemon`` forks before the mount is up.
+    ``replace`` stops instances already running and ``unique`` leaves them
+    be; only processes with all the arguments in ``match`` count as
+    instances, to tell a daemon from clients of the same program.
+    ``session`` restricts the service to the x11 or wayland backend.
+    """
+
+    def __init__(
+        self,
+        name,
+        command,
+        after=(),
+        ready=None,
+        oneshot=False,
+        restart=None,
+        replace=False,
+        unique=False,
+        match=(),
+        session=None,
+        timeout=10,
+    ):
+        self.name = name
+        self.command = command
+        self.after = after
+        self.ready = ready
+        self.oneshot = oneshot
+        self.restart = not oneshot if restart is None else restart
+        self.replace = replace
+        self.unique = unique
+        self.match = match
+        self.session = session
+        self.timeout = timeout
+
+
+class Supervisor:
+    """Start services in dependency order, as much in parallel as possible.
+
+    Each service waits only for the services it's declared ``after``. The
+    time from the start of the session to each service being ready is
+    recorded, and long-running services that exit are restarted with an
+    exponential backoff.
+    """
+
+    def __init__(self, services):
+        self.services = {service.name: service for service in services}
+        self.ready_after = {}
+        self._ready = {}
+        self._tasks = []
+        self._started = None
+
+    def start(self, session):
+        self._started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        selected = {
+            name: service
+            for name, service in self.services.items()
+            if service.session in (None, session)
+        }
+        self._ready = {name: asyncio.Event() for name in selected}
+        self._tasks = [
+            loop.create_task(self._supervise(service)) for service in selected.values()
+        ]
+        loop.create_task(self._report())
+
+    async def _report(self):
+        await asyncio.gather(*(event.wait() for event in self._ready.values()))
+        logger.info(
+            "Session ready in %.2fs: %s",
+            time.monotonic() - self._started,
+            ", ".join(f"{n} {t:.2f}s" for n, t in sorted(self.ready_after.items())),
+        )
+
+    async def _stop_running(self, service):
+        pids = pids_of(service.command, service.match)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + service.timeout
+        while pids_of(service.command, service.match) and time.monotonic() < deadline:
+            await asyncio.sleep(POLL)
+
+    async def _wait_ready(self, service, proc):
+        deadline = time.monotonic() + service.timeout
+        if service.oneshot:
+            try:
+                if await asyncio.wait_for(proc.wait(), service.timeout) != 0:
+                    return False
+            except asyncio.TimeoutError:
+                deadline = 0
+        while time.monotonic() < deadline:
+            if proc.returncode is not None and not service.oneshot:
+                return False
+            if service.ready is None or await service.ready():
+                return True
+            await asyncio.sleep(POLL)
+        logger.warning("%s not ready after %ss", service.name, service.timeout)
+        return False
+
+    def _mark_ready(self, service):
+        if not self._ready[service.name].is_set():
+            self.ready_after[service.name] = time.monotonic() - self._started
+            self._ready[service.name].set()
+
+    async def _supervise(self, service):
+        for name in service.after:
+            if name in self._ready:
+                await self._ready[name].wait()
+        if service.unique and pids_of(service.command, service.match):
+            self._mark_ready(service)
+            return
+        if service.replace:
+            await self._stop_running(service)
+        backoff = BACKOFF_START
+        while True:
+            launched = time.monotonic()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *service.command,
+                    stdin=DEVNULL,
+                    stdout=DEVNULL,
+                    stderr=DEVNULL,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                logger.warning("Could not start %s: %s", service.name, e)
+                # Don't hold up services that depend on this one
+                self._mark_ready(service)
+                return
+            # Dependents are released even if the wait failed, it was logged
+            await self._wait_ready(service, proc)
+            self._mark_ready(service)
+            if not service.restart:
+                return
+            code = await proc.wait()
+            if time.monotonic() - launched > STABLE_AFTER:
+                backoff = BACKOFF_START
+            logger.warning(
+                "%s exited with %s, restarting in %ss", service.name, code, backoff
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+# Seconds without a new window before switching
+DELAY = 0.15
+# Switch at the latest this long after the first window of a burst
+MAX_DELAY = 1.0
+SKIP_GROUPS = {"scratchpad"}
+SKIP_TYPES = {"dialog", "utility", "toolbar", "splash", "menu", "notification"}
+
+
+def is_transient(window):
+    """True for dialogs and other windows that belong to another window"""
+    get_transient = getattr(window, "is_transient_for", None)
+    if get_transient is not None and get_transient() is not None:
+        return True
+    get_type = getattr(getattr(window, "window", None), "get_wm_type", None)
+    return get_type is not None and get_type() in SKIP_TYPES
+
+
+class GroupSwitcher:
+    """Follow new windows to their group, once per burst of windows.
+
+    ``client_managed`` events are collected until ``DELAY`` passes without a
+    new one, or ``MAX_DELAY`` after the first, and then the screen switches
+    to the group of the last relevant window. Transient windows and windows
+    in scratchpads never cause a switch.
+    """
+
+    def __init__(self, delay=DELAY, max_delay=MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.switches = 0
+        self._window = None
+        self._first = None
+        self._handle = None
+
+    def client_managed(self, qtile, window):
+        if window.group is None or window.group.name in SKIP_GROUPS:
+            return
+        if is_transient(window):
+            return
+        now = time.monotonic()
+        if self._handle is None:
+            self._first = now
+        else:
+            self._handle.cancel()
+        self._window = window
+        delay = min(self.delay, self._first + self.max_delay - now)
+        self._handle = qtile.call_later(max(delay, 0), self._switch, qtile)
+
+    def _switch(self, qtile):
+        window, self._window, self._handle = self._window, None, None
+        # The window may have been closed or moved in the meantime
+        group = window.group
+        if group is None or group.name == qtile.current_group.name:
+            return
+        self.switches += 1
+        group.toscreen()
+
+
+class _Group:
+    def __init__(self, qtile, name):
+        self.qtile = qtile
+        self.name = name
+
+    def toscreen(self):
+        self.qtile.current_group = self
+        self.qtile.layouts += 1
+
+
+class _Window:
+    def __init__(self, group, transient=False):
+        self.group = group
+        self.transient = transient
+
+    def is_transient_for(self):
+        return self if self.transient else None
+
+
+class _Qtile:
+    """Just enough of qtile to replay client_managed events"""
+
+    def __init__(self, names):
+        self.groups = {name: _Group(self, name) for name in names}
+        self.current_group = self.groups[names[0]]
+        self.layouts = 0
+
+    def call_later(self, delay, func, *args):
+        return asyncio.get_running_loop().call_later(delay, func, *args)
+
+
+async def _replay(events, gap, handler):
+    """Manage one window per ``(group, transient)`` event, ``gap`` apart"""
+    qtile = _Qtile(["1", "2", "3", "9", "scratchpad"])
+    for name, transient in events:
+        handler(qtile, _Window(qtile.groups[name], transient))
+        await asyncio.sleep(gap)
+    await asyncio.sleep(MAX_DELAY)
+    return qtile.layouts, qtile.current_group.name
+
+
+def _immediate(qtile, window):
+    if window.group.name != qtile.current_group.name:
+        window.group.toscreen()
+
+
+if __name__ == "__main__":
+    # A session start: Steam and its dialogs, the IDE, the dropdowns,
+    # finishing with the browser
+    burst = [("9", False), ("9", True), ("2", False), ("scratchpad", False)] * 10
+    burst += [("2", True), ("3", False)]
+    layouts, group = asyncio.run(_replay(burst, 0.01, _immediate))
+    print(f"immediate: {len(burst)} windows, {layouts} layout passes")
+    switcher = GroupSwitcher()
+    layouts, group = asyncio.run(_replay(burst, 0.01, switcher.client_managed))
+    print(f"debounced: {len(burst)} windows, {layouts} layout passes")
+    assert switcher.switches == 1, switcher.switches
+    assert layouts == 1, layouts
+    assert group == "3", group
+    # Dialogs and dropdowns alone never switch
+    switcher = GroupSwitcher()
+    quiet = [("2", True), ("scratchpad", False)] * 5
+    layouts, group = asyncio.run(_replay(quiet, 0.01, switcher.client_managed))
+    assert (switcher.switches, layouts, group) == (0, 0, "1")
+    print("ok")
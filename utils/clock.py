@@ -0,0 +1,59 @@
+import re
+from datetime import datetime, timedelta
+
+SECOND = 1
+MINUTE = 60
+HOUR = 60 * 60
+DAY = 24 * 60 * 60
+
+# strftime directives grouped by the smallest unit of time they display.
+_DIRECTIVES = {
+    SECOND: set("ScfsTXr"),
+    MINUTE: set("MR"),
+    HOUR: set("HIklp"),
+}
+
+_DIRECTIVE_RE = re.compile(r"%[-_0^#]?(.)")
+
+
+def format_resolution(fmt):
+    """Return the smallest unit of time, in seconds, that ``fmt`` displays"""
+    used = {m.group(1) for m in _DIRECTIVE_RE.finditer(fmt.replace("%%", ""))}
+    for resolution in (SECOND, MINUTE, HOUR):
+        if used & _DIRECTIVES[resolution]:
+            return resolution
+    return DAY
+
+
+def next_change(fmt, now):
+    """Return the timestamp at which ``now.strftime(fmt)`` next changes.
+
+    Hour and day boundaries are found on the wall clock and then given the
+    offset the zone has there, so a day is 23 or 25 hours long across a DST
+    transition. That needs ``now`` naive in local time or in a zone with
+    the DST rules, like ZoneInfo; a fixed offset such as the one
+    ``astimezone()`` attaches keeps the old offset.
+    """
+    resolution = format_resolution(fmt)
+    if resolution in (SECOND, MINUTE):
+        # UTC offsets are whole minutes, so these are the same in any zone
+        timestamp = now.timestamp()
+        return timestamp - timestamp % resolution + resolution
+    start = now.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    if resolution == DAY:
+        start = start.replace(hour=0)
+    wall = start + timedelta(seconds=resolution)
+    zone = now.tzinfo
+    if zone is None:
+        return wall.timestamp()
+    if hasattr(zone, "localize"):
+        # pytz zones need localize() to pick the offset at ``wall``
+        return zone.localize(wall).timestamp()
+    return wall.replace(tzinfo=zone).timestamp()
+
+
+def seconds_until_change(fmt, now=None):
+    """Return how long ``fmt`` keeps rendering the same string"""
+    if now is None:
+        now = datetime.now()
+    return max(next_change(fmt, now) - now.timestamp(), 0)
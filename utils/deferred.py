@@ -0,0 +1,87 @@
+"""Config objects whose class is imported when they're first used.
+
+``widgets = Namespace("qtile_extras.widget")`` gives a namespace where
+``widgets.TextBox(text="x")`` records the class and arguments without
+importing anything. The widget is built by ``BatchedBar`` when the bar is
+configured, extensions when their key is first pressed, and arguments that
+are themselves deferred, like decorations, are built along with them. The
+arguments are kept on the built object as ``_deferred``, so a reload can
+tell an unchanged widget without building the new one.
+"""
+
+import importlib
+
+import libqtile
+
+
+class Deferred:
+    """The class ``name`` from ``module`` and the arguments to build it with"""
+
+    def __init__(self, module, name, *args, **kwargs):
+        self.module = module
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self._built = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return f"Deferred({self.module}.{self.name})"
+
+    def when_built(self, callback):
+        """Call ``callback`` with the object once it's built"""
+        if self._built is not None:
+            callback(self._built)
+        else:
+            self._callbacks.append(callback)
+
+    def build(self):
+        if self._built is None:
+            cls = getattr(importlib.import_module(self.module), self.name)
+            args = [build(arg) for arg in self.args]
+            kwargs = {key: build(value) for key, value in self.kwargs.items()}
+            self._built = cls(*args, **kwargs)
+            self._built._deferred = self
+            for callback in self._callbacks:
+                callback(self._built)
+            self._callbacks = []
+        return self._built
+
+
+class DeferredExtension(Deferred):
+    """An extension for ``lazy.run_extension()``, built on first run.
+
+    qtile configures the extensions that exist when the config is loaded,
+    so the one built here is configured with the running qtile instead.
+    """
+
+    def run(self):
+        if self._built is None:
+            self.build()._configure(libqtile.qtile)
+        return self._built.run()
+
+
+def build(value):
+    """``value`` with the deferred objects in it built"""
+    if isinstance(value, Deferred):
+        return value.build()
+    if isinstance(value, (list, tuple)):
+        return type(value)(build(item) for item in value)
+    if isinstance(value, dict):
+        return {key: build(item) for key, item in value.items()}
+    return value
+
+
+class Namespace:
+    """Deferred objects of the classes in ``module``, by attribute"""
+
+    def __init__(self, module, deferred=Deferred):
+        self._module = module
+        self._deferred = deferred
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._deferred(
+            self._module, name, *args, **kwargs
+        )
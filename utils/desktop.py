@@ -0,0 +1,355 @@
+"""Application launcher over an index of XDG desktop entries.
+
+The entries of every applications directory are parsed once and kept in
+~/.cache/qtile/desktop-index.json with the mtimes they were read at. On
+start only directories whose mtime changed are read again, and inside
+qtile inotify marks directories as they change, so opening the menu reads
+nothing but the index. Applications are offered most launched first.
+
+Run from the config directory, it prints the menu, or times it:
+
+    python3 -m utils.desktop [--benchmark [COUNT]]
+"""
+
+import json
+import os
+import re
+import shlex
+import sys
+
+from utils.dmenu import (
+    CACHE_DIR,
+    IndexedMenu,
+    Usage,
+    print_timings,
+    time_to_menu,
+    write_json,
+)
+
+INDEX = os.path.join(CACHE_DIR, "desktop-index.json")
+USAGE = os.path.join(CACHE_DIR, "desktop-usage.json")
+# Bumped when the parsed fields change
+VERSION = 1
+FIELD_RE = re.compile(r"%(.)")
+DESKTOP = os.environ.get("XDG_CURRENT_DESKTOP", "qtile").split(":")
+
+
+def application_dirs():
+    """Applications directories, highest precedence first"""
+    home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    data = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+    return [
+        os.path.join(base, "applications")
+        for base in dict.fromkeys([home, *data.split(":")])
+        if base
+    ]
+
+
+def _locales():
+    """Name keys to look for, most specific first, like Name[pt_BR]"""
+    lang = os.environ.get("LC_MESSAGES") or os.environ.get("LANG") or ""
+    lang = lang.split(".")[0].split("@")[0]
+    keys = [f"Name[{lang}]", f"Name[{lang.split('_')[0]}]"] if lang else []
+    return [*dict.fromkeys(keys), "Name"]
+
+
+def parse_entry(path, names=None):
+    """The ``[name, exec, categories, visible, terminal, icon]`` of an entry.
+
+    Entries that are hidden, not applications or not for this desktop are
+    kept as invisible, they still hide entries with the same id further
+    down the data directories.
+    """
+    names = names or _locales()
+    fields = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            group = None
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    if group == "[Desktop Entry]":
+                        break
+                    group = line
+                elif group == "[Desktop Entry]" and "=" in line:
+                    key, _, value = line.partition("=")
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+    name = next((fields[key] for key in names if key in fields), "")
+    visible = (
+        fields.get("Type") == "Application"
+        and bool(name)
+        and "Exec" in fields
+        and fields.get("NoDisplay") != "true"
+        and fields.get("Hidden") != "true"
+        and _for_desktop(fields)
+    )
+    return [
+        name,
+        fields.get("Exec", ""),
+        [c for c in fields.get("Categories", "").split(";") if c],
+        visible,
+        fields.get("Terminal") == "true",
+        fields.get("Icon", ""),
+    ]
+
+
+def _for_desktop(fields):
+    only = [d for d in fields.get("OnlyShowIn", "").split(";") if d]
+    hidden = [d for d in fields.get("NotShowIn", "").split(";") if d]
+    if only and not set(only) & set(DESKTOP):
+        return False
+    return not set(hidden) & set(DESKTOP)
+
+
+class DesktopIndex:
+    """Parsed desktop entries of the applications directories.
+
+    ``dirs`` maps each directory under the roots to its mtime and root,
+    ``files`` each entry file to its mtime, size and parsed entry.
+    """
+
+    def __init__(self, roots=None, cache=INDEX):
+        self.roots = roots or application_dirs()
+        self.cache = cache
+        self.dirs = {}
+        self.files = {}
+        self.version = 0
+        self._applications = None
+
+    def load(self):
+        """Read the cached index and bring it up to date"""
+        try:
+            with open(self.cache) as f:
+                saved = json.load(f)
+            if saved["version"] == VERSION and saved["roots"] == self.roots:
+                self.dirs = saved["dirs"]
+                self.files = saved["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        if self.refresh(self.changed()):
+            self.save()
+        return self
+
+    def changed(self):
+        """Directories whose mtime moved, and roots not read yet"""
+        stale = [path for path in self.dirs if self._changed(path)]
+        return stale + [root for root in self.roots if root not in self.dirs]
+
+    def watched(self):
+        # Roots that don't exist yet are noticed by their parent
+        parents = {os.path.dirname(root) for root in self.roots}
+        return [*self.dirs, *filter(os.path.isdir, parents)]
+
+    def polled(self):
+        return []
+
+    def _changed(self, path):
+        try:
+            return os.stat(path).st_mtime_ns != self.dirs[path][0]
+        except OSError:
+            return True
+
+    def refresh(self, dirs):
+        """Read ``dirs`` again, returns whether anything changed"""
+        before = self.version
+        names = _locales()
+        for path in sorted(dirs, key=len):
+            root = next((r for r in self.roots if _under(path, r)), None)
+            if root is not None:
+                self._scan(path, root, names)
+                continue
+            # The parent of roots, which may have been created
+            for root in self.roots:
+                if os.path.dirname(root) == path and root not in self.dirs:
+                    self._scan(root, root, names)
+        return self.version != before
+
+    def _scan(self, path, root, names):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError:
+            if path in self.dirs:
+                self._drop(path)
+            return
+        self.dirs[path] = [mtime, root]
+        present = set()
+        for entry in entries:
+            present.add(entry.path)
+            try:
+                if entry.is_dir():
+                    if entry.path not in self.dirs or self._changed(entry.path):
+                        self._scan(entry.path, root, names)
+                    continue
+                if not entry.name.endswith(".desktop"):
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            known = self.files.get(entry.path)
+            if known is None or known[:2] != [stat.st_mtime_ns, stat.st_size]:
+                parsed = parse_entry(entry.path, names)
+                self.files[entry.path] = [stat.st_mtime_ns, stat.st_size, parsed]
+                self.version += 1
+        for gone in [p for p in self.files if os.path.dirname(p) == path]:
+            if gone not in present:
+                del self.files[gone]
+                self.version += 1
+        for gone in [p for p in self.dirs if os.path.dirname(p) == path]:
+            if gone not in present:
+                self._drop(gone)
+
+    def _drop(self, path):
+        """Forget a directory that's gone, and everything under it"""
+        for d in [d for d in self.dirs if _under(d, path)]:
+            del self.dirs[d]
+        for f in [f for f in self.files if _under(f, path)]:
+            del self.files[f]
+        self.version += 1
+
+    def save(self):
+        write_json(
+            self.cache,
+            {
+                "version": VERSION,
+                "roots": self.roots,
+                "dirs": self.dirs,
+                "files": self.files,
+            },
+        )
+
+    def applications(self):
+        """Visible entries by desktop file id, the first root's file winning"""
+        if self._applications is None or self._applications[0] != self.version:
+            by_root = {root: [] for root in self.roots}
+            for path, (_, _, entry) in self.files.items():
+                root = self.dirs[os.path.dirname(path)][1]
+                by_root[root].append((path[len(root) + 1 :], path, entry))
+            found = {}
+            for root in self.roots:
+                for relative, path, entry in by_root[root]:
+                    found.setdefault(relative.replace(os.sep, "-"), (path, entry))
+            apps = {
+                file_id: (path, entry)
+                for file_id, (path, entry) in found.items()
+                if entry is not None and entry[3]
+            }
+            self._applications = (self.version, apps)
+        return self._applications[1]
+
+
+def _under(path, directory):
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def command(path, entry, terminal=None):
+    """The Exec line of an entry with its field codes expanded"""
+    name, exec_, _, _, in_terminal, icon = entry
+    codes = {
+        "%": "%",
+        "i": f"--icon {shlex.quote(icon)}" if icon else "",
+        "c": shlex.quote(name),
+        "k": shlex.quote(path),
+    }
+    cmd = FIELD_RE.sub(lambda m: codes.get(m[1], ""), exec_).strip()
+    if in_terminal and terminal:
+        cmd = f"{terminal} -e {cmd}"
+    return cmd
+
+
+def ranked(applications, usage):
+    """Names and ids, most launched first, then by name"""
+    items = [(entry[0], file_id) for file_id, (_, entry) in applications.items()]
+    return sorted(items, key=lambda i: (-usage.score(i[1]), i[0].casefold()))
+
+
+class Launcher(IndexedMenu):
+    """Pick an application in dmenu and start it, from inside qtile"""
+
+    def __init__(
+        self,
+        prompt="Apps ",
+        lines=10,
+        ignorecase=True,
+        dmenu="dmenu -vi",
+        terminal=None,
+    ):
+        super().__init__(prompt, lines, ignorecase, dmenu)
+        self.terminal = terminal
+
+    def load(self):
+        return DesktopIndex().load(), Usage(USAGE)
+
+    def entries(self):
+        return ranked(self.index.applications(), self.usage)
+
+    def launch(self, qtile, choice, file_id):
+        if file_id is None:
+            return None
+        path, entry = self.index.applications()[file_id]
+        qtile.spawn(command(path, entry, self.terminal))
+        return file_id
+
+
+def _write_tree(root, count, seed=0):
+    """``count`` synthetic desktop entries, some in subdirectories"""
+    import random
+
+    rng = random.Random(seed)
+    words = ["Studio", "Player", "Editor", "Viewer", "Manager", "Steam", "Game"]
+    categories = ["Game", "Development", "AudioVideo", "Utility", "Office"]
+    for i in range(count):
+        directory = os.path.join(root, f"vendor{i % 20}") if i % 3 == 0 else root
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"app{i}.desktop"), "w") as f:
+            f.write(
+                "[Desktop Entry]\n"
+                "Type=Application\n"
+                f"Name={rng.choice(words)} {i}\n"
+                f"Name[de]={rng.choice(words)} {i} (de)\n"
+                f"Comment=Synthetic entry {i}\n"
+                f"Exec=/opt/app{i}/bin/app{i} %U\n"
+                f"Icon=app{i}\n"
+                f"Categories={rng.choice(categories)};\n"
+                f"NoDisplay={'true' if i % 50 == 0 else 'false'}\n"
+                "\n[Desktop Action new-window]\nName=New Window\nExec=true\n"
+            )
+
+
+def _benchmark(count):
+    import shutil
+    import subprocess
+    import tempfile
+    import time
+
+    def menu(index):
+        items = ranked(index.applications(), Usage(os.devnull))
+        return "".join(f"{name}\n" for name, _ in items)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "share", "applications")
+        _write_tree(root, count)
+        cache = os.path.join(tmp, "index.json")
+        timings = time_to_menu(lambda: DesktopIndex([root], cache).load(), menu)
+        if shutil.which("j4-dmenu-desktop"):
+            env = dict(os.environ, XDG_DATA_HOME=os.path.join(tmp, "share"))
+            env["XDG_DATA_DIRS"] = os.path.join(tmp, "none")
+            start = time.perf_counter()
+            subprocess.run(
+                ["j4-dmenu-desktop", "--dmenu", "tail -n 1", "--no-exec"],
+                env=env,
+                capture_output=True,
+            )
+            timings["j4-dmenu-desktop"] = time.perf_counter() - start
+    print_timings(f"{count} desktop files", timings)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--benchmark"]:
+        _benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        index = DesktopIndex().load()
+        for name, _ in ranked(index.applications(), Usage(USAGE)):
+            print(name)
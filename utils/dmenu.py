@@ -0,0 +1,236 @@
+"""dmenu menus over an on-disk index, shown from inside qtile.
+
+``IndexedMenu`` is what the application launcher and the command runner
+share: it loads the index in a thread on first show and keeps it current
+with inotify, reading only the directories that changed before the next
+show, feeds dmenu a menu that is rebuilt only when the index or the usage
+changed, and records what was chosen. The index and the ranking are the
+subclass's.
+"""
+
+import asyncio
+import json
+import os
+import shlex
+import time
+from asyncio.subprocess import DEVNULL, PIPE
+
+from utils.inotify import DirectoryWatcher, has_inotify
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "qtile"
+)
+
+
+def write_json(path, data):
+    """Replace ``path`` with ``data`` at once, readers never see half of it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(data, separators=(",", ":")))
+    os.replace(tmp, path)
+
+
+def dmenu_command(defaults, prompt, lines, ignorecase, dmenu="dmenu -vi"):
+    """dmenu with the colours and font of ``extension_defaults``"""
+    args = shlex.split(dmenu)
+    if ignorecase:
+        args.append("-i")
+    if lines:
+        args += ["-l", str(lines)]
+    if prompt:
+        args += ["-p", prompt]
+    # The way libqtile's Dmenu extension picks the font
+    font = defaults.get("dmenu_font")
+    if not font and defaults.get("font"):
+        font = defaults["font"]
+        if defaults.get("fontsize"):
+            font = f"{font}-{defaults['fontsize']}"
+    if font:
+        args += ["-fn", font]
+    for option, key in (
+        ("-nb", "background"),
+        ("-nf", "foreground"),
+        ("-sb", "selected_background"),
+        ("-sf", "selected_foreground"),
+    ):
+        if defaults.get(key):
+            args += [option, defaults[key]]
+    return args
+
+
+class Usage:
+    """How often, and how lately, each menu entry was chosen.
+
+    ``counts`` maps each key to its count and the number of choices made
+    before it was last chosen, ``runs`` is the number of choices made.
+    With ``recency``, a choice counts half once ``recency`` more were made
+    after it, without it only the count matters.
+    """
+
+    def __init__(self, path, recency=None):
+        self.path = path
+        self.recency = recency
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            self.counts = saved["counts"]
+            self.runs = saved["runs"]
+        except (OSError, ValueError, KeyError):
+            self.counts = {}
+            self.runs = 0
+
+    def record(self, key):
+        count = self.counts.get(key, [0, 0])[0]
+        self.counts[key] = [count + 1, self.runs]
+        self.runs += 1
+        write_json(self.path, {"counts": self.counts, "runs": self.runs})
+
+    def score(self, key):
+        count, last = self.counts.get(key, (0, 0))
+        if self.recency is None:
+            return count
+        return count / (1 + (self.runs - last) / self.recency)
+
+
+class IndexedMenu:
+    """Pick an entry of an index in dmenu, from inside qtile.
+
+    Subclasses implement ``load``, returning the index and the ``Usage``,
+    ``entries``, the ranked ``(label, key)`` pairs to offer, and
+    ``launch``. The index has ``version``, bumped on every change, and
+    ``refresh``, ``save``, ``changed`` for the directories whose mtime
+    moved, ``watched`` for those inotify should watch and ``polled`` for
+    those it can't and that are checked on every show.
+
+    A menu built by a config reload takes over the index of the one it
+    replaces on its first show, and stops that one's watcher.
+    """
+
+    # The menu of each class in use
+    running = {}
+
+    def __init__(self, prompt, lines=10, ignorecase=True, dmenu="dmenu -vi"):
+        self.prompt = prompt
+        self.lines = lines
+        self.ignorecase = ignorecase
+        self.dmenu = dmenu
+        self.index = None
+        self.usage = None
+        self._stale = set()
+        self._watcher = None
+        self._menu = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def entries(self):
+        raise NotImplementedError
+
+    def launch(self, qtile, choice, key):
+        """Start ``choice``, ``key`` is None if it was typed.
+
+        Returns the key to record, or None if nothing was started.
+        """
+        raise NotImplementedError
+
+    def show(self, qtile):
+        return asyncio.get_running_loop().create_task(self.run(qtile))
+
+    async def run(self, qtile):
+        if self.index is None:
+            self._take_over()
+        if self.index is None:
+            self.index, self.usage = await asyncio.to_thread(self.load)
+            self._watch()
+        elif self._stale or self._watcher is None or self.index.polled():
+            stale = self._stale if self._watcher is not None else None
+            self._stale = set()
+            await asyncio.to_thread(self._refresh, stale)
+            if self._watcher is None:
+                self._watch()
+            else:
+                self._watcher.watch(self.index.watched())
+
+        version = (self.index.version, self.usage.runs)
+        if self._menu is None or self._menu[0] != version:
+            entries = self.entries()
+            keys = {}
+            for label, key in entries:
+                keys.setdefault(label, key)
+            menu = "".join(f"{label}\n" for label, _ in entries).encode()
+            self._menu = (version, keys, menu)
+        _, keys, menu = self._menu
+        defaults = getattr(qtile.config, "extension_defaults", {})
+        args = dmenu_command(
+            defaults, self.prompt, self.lines, self.ignorecase, self.dmenu
+        )
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdin=PIPE, stdout=PIPE, stderr=DEVNULL
+        )
+        out, _ = await proc.communicate(menu)
+        choice = out.decode().strip()
+        if not choice:
+            return None
+        key = self.launch(qtile, choice, keys.get(choice))
+        if key is not None:
+            await asyncio.to_thread(self.usage.record, key)
+        return key
+
+    def _take_over(self):
+        previous = IndexedMenu.running.get(type(self))
+        IndexedMenu.running[type(self)] = self
+        if previous is None or previous is self or previous.index is None:
+            return
+        if previous._watcher is not None:
+            previous._watcher.stop()
+            previous._watcher = None
+        # Without a watcher every directory is checked before the first show
+        self.index, self.usage = previous.index, previous.usage
+
+    def _refresh(self, stale):
+        """Read the directories inotify reported, or check them all"""
+        if stale is None:
+            stale = self.index.changed()
+        if self.index.refresh([*stale, *self.index.polled()]):
+            self.index.save()
+
+    def _watch(self):
+        if not has_inotify:
+            return
+        try:
+            self._watcher = DirectoryWatcher(self._changed)
+            self._watcher.start()
+        except OSError:
+            self._watcher = None
+            return
+        self._watcher.watch(self.index.watched())
+
+    def _changed(self, dirs):
+        if dirs is None:
+            # Events were lost, check everything on the next show
+            self._watcher.stop()
+            self._watcher = None
+        else:
+            self._stale |= dirs
+
+
+def time_to_menu(load, menu):
+    """Seconds from nothing cached, from the cached index and inside qtile"""
+    timings = {}
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        index = load()
+        menu(index)
+        timings[label] = time.perf_counter() - start
+    start = time.perf_counter()
+    menu(index)
+    timings["in qtile"] = time.perf_counter() - start
+    return timings
+
+
+def print_timings(what, timings):
+    print(
+        f"{what}, time to menu: "
+        + ", ".join(f"{name} {t * 1e3:.1f}ms" for name, t in timings.items())
+    )
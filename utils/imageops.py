@@ -0,0 +1,329 @@
+"""Screenshot post-processing on decoded pixels.
+
+An image is decoded once into an RGBA array, every operation works on the
+array and the result is encoded once. Without NumPy and Pillow the same
+operations fall back to ImageMagick, one process per operation, as do
+operations given a colour name Pillow doesn't know or a geometry that
+isn't a plain size.
+
+Run as a script, it filters a PNG from stdin to stdout:
+
+    flameshot gui -r | python3 imageops.py trim border '#81A1C1' 2 1
+"""
+
+import io
+import re
+import subprocess
+import sys
+import time
+
+try:
+    import numpy as np
+    from PIL import Image, ImageColor
+
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Lower than zlib's default, screenshots are mostly flat areas anyway
+COMPRESS_LEVEL = 3
+# 75%, 200, x300, 200x300 or 200x300!; magick's other flags are left to it
+SIZE_RE = re.compile(r"^(?:(\d+(?:\.\d+)?)%|(\d+)?(?:x(\d+))?(!?))$")
+
+
+def decode(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert("RGBA"))
+
+
+def encode(pixels):
+    out = io.BytesIO()
+    Image.fromarray(pixels, "RGBA").save(out, "PNG", compress_level=COMPRESS_LEVEL)
+    return out.getvalue()
+
+
+class Unsupported(ValueError):
+    """An argument only ImageMagick understands, the operation is left to it"""
+
+
+class UnknownColor(Unsupported):
+    """A colour name Pillow doesn't know"""
+
+
+def parse_color(color):
+    """RGBA of a CSS-style colour: ``#fff``, ``#81A1C1``, ``black``, ``none``"""
+    if color.lower() in ("none", "transparent"):
+        return (0, 0, 0, 0)
+    try:
+        rgba = ImageColor.getrgb(color)
+    except ValueError:
+        raise UnknownColor(color) from None
+    return rgba if len(rgba) == 4 else (*rgba, 255)
+
+
+def _words(pixels):
+    """View RGBA pixels as one 32 bit word each"""
+    return np.ascontiguousarray(pixels).view(np.uint32)[..., 0]
+
+
+def _word(rgba):
+    return np.array([rgba], np.uint8).view(np.uint32)[0]
+
+
+def trim(pixels, fuzz=0.0):
+    """Crop to the bounding box of pixels unlike the top left corner"""
+    if fuzz:
+        distance = np.abs(pixels.astype(np.int16) - pixels[0, 0]).max(axis=2)
+        content = distance > fuzz * 255
+    else:
+        words = _words(pixels)
+        content = words != words[0, 0]
+    rows = np.flatnonzero(content.any(axis=1))
+    if not rows.size:
+        return pixels
+    cols = np.flatnonzero(content[rows[0] : rows[-1] + 1].any(axis=0))
+    return pixels[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+
+
+def transparent(pixels, color="white", fuzz=0.0):
+    """Make pixels within ``fuzz`` of ``color`` transparent.
+
+    The distance is ImageMagick's: RMS over the RGB channels, as a fraction
+    of the full range.
+    """
+    rgb = parse_color(color)[:3]
+    if fuzz:
+        diff = pixels[..., :3].astype(np.int32) - rgb
+        squared = np.einsum("ijk,ijk->ij", diff, diff)
+        match = squared <= 3 * (fuzz * 255) ** 2
+    else:
+        match = (_words(pixels) & _word((255, 255, 255, 0))) == _word((*rgb, 0))
+    out = pixels.copy()
+    out[..., 3][match] = 0
+    return out
+
+
+def _corner(radius, thickness):
+    """Masks for the top left corner: outside the rounding, and the stroke"""
+    size = radius + thickness
+    centers = np.arange(size) + 0.5
+    distance = np.hypot(size - centers[:, None], size - centers[None, :])
+    return distance > size, distance > radius
+
+
+def border(pixels, color="#81A1C1", thickness=2, radius=1):
+    """Add a border with rounded corners, transparent outside of them"""
+    height, width = pixels.shape[:2]
+    out = np.empty((height + 2 * thickness, width + 2 * thickness, 4), np.uint8)
+    rgba = parse_color(color)
+    out[...] = rgba
+    out[thickness : thickness + height, thickness : thickness + width] = pixels
+    outside, stroke = _corner(radius, thickness)
+    size = outside.shape[0]
+    for rows in (slice(0, size), slice(-size, None)):
+        for cols in (slice(0, size), slice(-size, None)):
+            # Flip the top left masks into place
+            flip = (
+                slice(None, None, 1 if rows.start == 0 else -1),
+                slice(None, None, 1 if cols.start == 0 else -1),
+            )
+            corner = out[rows, cols]
+            corner[stroke[flip]] = rgba
+            corner[outside[flip]] = 0
+    return out
+
+
+def resize(pixels, size):
+    """Resize to a geometry like magick's -resize.
+
+    "75%" scales, "200" and "x300" set the width or the height, "200x300"
+    fits in the box and "200x300!" stretches to it, keeping the aspect
+    ratio but for the last.
+    """
+    match = SIZE_RE.match(size.replace(" ", ""))
+    if match is None or not (match[1] or match[2] or match[3]):
+        raise Unsupported(size)
+    height, width = pixels.shape[:2]
+    if match[1]:
+        scale = float(match[1]) / 100
+        target = (width * scale, height * scale)
+    elif match[4]:
+        target = (int(match[2] or width), int(match[3] or height))
+    else:
+        scales = []
+        if match[2]:
+            scales.append(int(match[2]) / width)
+        if match[3]:
+            scales.append(int(match[3]) / height)
+        scale = min(scales)
+        target = (width * scale, height * scale)
+    target = tuple(max(1, round(n)) for n in target)
+    image = Image.fromarray(pixels, "RGBA").resize(target, Image.LANCZOS)
+    return np.asarray(image)
+
+
+OPERATIONS = {
+    "trim": trim,
+    "transparent": transparent,
+    "border": border,
+    "resize": resize,
+}
+
+
+def process(data, operations):
+    """Apply ``(name, args)`` operations to a PNG and return the new PNG"""
+    if not operations:
+        return data
+    if not has_numpy:
+        for name, args in operations:
+            data = run_magick(data, magick_args(name, *args))
+        return data
+    pixels = decode(data)
+    for name, args in operations:
+        try:
+            pixels = OPERATIONS[name](pixels, *args)
+        except Unsupported:
+            data = encode(np.ascontiguousarray(pixels))
+            pixels = decode(run_magick(data, magick_args(name, *args)))
+    return encode(np.ascontiguousarray(pixels))
+
+
+def magick_args(name, *args):
+    """The ImageMagick arguments dmenu_screenshot used for an operation"""
+    if name == "trim":
+        return ["-trim"]
+    if name == "transparent":
+        color = args[0] if args else "white"
+        fuzz = args[1] if len(args) > 1 else 0.0
+        return ["-fuzz", f"{fuzz * 100:g}%", "-transparent", color]
+    if name == "resize":
+        return ["-resize", args[0]]
+    color, thickness, radius = (list(args) + ["#81A1C1", 2, 1][len(args) :])[:3]
+    return [
+        "-format",
+        f"roundrectangle 4,3 %[fx:w+0],%[fx:h+0] {radius},{radius}",
+        "-write",
+        "info:/tmp/tmp.mvg",
+        "-alpha",
+        "set",
+        "-bordercolor",
+        color,
+        "-border",
+        str(thickness),
+        "(",
+        "+clone",
+        "-alpha",
+        "transparent",
+        "-background",
+        "none",
+        "-fill",
+        "white",
+        "-stroke",
+        "none",
+        "-strokewidth",
+        "0",
+        "-draw",
+        "@/tmp/tmp.mvg",
+        ")",
+        "-compose",
+        "DstIn",
+        "-composite",
+        "(",
+        "+clone",
+        "-alpha",
+        "transparent",
+        "-background",
+        "none",
+        "-fill",
+        "none",
+        "-stroke",
+        color,
+        "-strokewidth",
+        str(thickness),
+        "-draw",
+        "@/tmp/tmp.mvg",
+        ")",
+        "-compose",
+        "Over",
+        "-composite",
+    ]
+
+
+def run_magick(data, args):
+    command = ["magick", "png:-", *args, "png:-"]
+    return subprocess.run(command, input=data, capture_output=True, check=True).stdout
+
+
+def parse_operations(argv):
+    """Parse ``trim transparent white 0.1 border ...`` into operations"""
+    operations = []
+    for word in argv:
+        if word in OPERATIONS:
+            operations.append((word, []))
+        elif operations:
+            name, args = operations[-1]
+            if name == "resize":
+                # Geometries stay strings, "200" is a width
+                args.append(word)
+            else:
+                args.append(int(word) if word.isdigit() else _number(word))
+        else:
+            raise ValueError(f"Unknown operation: {word}")
+    return operations
+
+
+def _number(word):
+    try:
+        return float(word)
+    except ValueError:
+        return word
+
+
+def _frame(width, height):
+    """A synthetic screenshot: a window on a white background"""
+    pixels = np.full((height, width, 4), 255, np.uint8)
+    y, x = np.mgrid[0 : height // 2, 0 : width // 2]
+    window = pixels[height // 4 : height // 4 * 3, width // 4 : width // 4 * 3]
+    window[..., 0] = x * 255 // (width // 2)
+    window[..., 1] = y * 255 // (height // 2)
+    window[..., 2] = (x ^ y) & 255
+    return encode(pixels)
+
+
+def _since(start):
+    return (time.perf_counter() - start) * 1e3
+
+
+def _benchmark():
+    actions = {
+        "Trim": [("trim", [])],
+        "Remove white": [("transparent", ["white", 0.1])],
+        "Bordered": [("border", ["#81A1C1", 2, 1])],
+        "Scaled": [("resize", ["75%"])],
+    }
+    try:
+        subprocess.run(["magick", "-version"], capture_output=True, check=True)
+        has_magick = True
+    except (OSError, subprocess.CalledProcessError):
+        has_magick = False
+    for label, (width, height) in (("1080p", (1920, 1080)), ("4K", (3840, 2160))):
+        data = _frame(width, height)
+        for action, operations in actions.items():
+            start = time.perf_counter()
+            process(data, operations)
+            line = f"{label} {action}: numpy {_since(start):.0f}ms"
+            if has_magick:
+                start = time.perf_counter()
+                for name, args in operations:
+                    run_magick(data, magick_args(name, *args))
+                line += f", magick {_since(start):.0f}ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--benchmark"]:
+        _benchmark()
+    else:
+        sys.stdout.buffer.write(
+            process(sys.stdin.buffer.read(), parse_operations(sys.argv[1:]))
+        )
@@ -0,0 +1,105 @@
+"""Import time of config.py on the X11 and Wayland startup paths.
+
+Each backend's config is imported in a fresh interpreter under
+``python -X importtime``, with ``qtile.core.name`` set to the backend and
+no qtile running. The deferred widgets of its bars are then built, as
+they are when qtile configures the bars, so what startup pays for them
+is counted too. Prints the median total over the runs, the modules that
+cost the most and the ones only one of the backends imports:
+
+    python3 utils/importtime.py [RUNS]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+BACKENDS = ("x11", "wayland")
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sets the backend the config sees, the way qtile's core would
+RUNNER = """
+import sys, types
+import libqtile
+core = types.SimpleNamespace(name=sys.argv[1])
+libqtile.qtile = types.SimpleNamespace(core=core)
+sys.path.insert(0, sys.argv[2])
+import config
+import time
+from utils.deferred import Deferred
+start = time.perf_counter()
+for screen in config.screens:
+    for position in (screen.top, screen.bottom, screen.left, screen.right):
+        for widget in getattr(position, "widgets", ()):
+            if isinstance(widget, Deferred):
+                widget.build()
+print(round((time.perf_counter() - start) * 1e6))
+"""
+# Stands for the time building the deferred widgets took, imports included
+BUILD = "(building deferred widgets)"
+TOP = 15
+
+
+def parse(output):
+    """Cumulative microseconds of config and each module imported for it.
+
+    Those are the modules config imported, and the ones imported after it,
+    when the deferred widgets were built.
+    """
+    lines = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        lines.append((name.strip(), int(cumulative), len(name) - len(name.lstrip())))
+    # A module's line comes right after those of the modules it imported
+    index = max(i for i, (name, _, _) in enumerate(lines) if name == "config")
+    depth = lines[index][2]
+    modules = {"config": lines[index][1]}
+    for name, us, indent in reversed(lines[:index]):
+        if indent <= depth:
+            break
+        modules[name] = us
+    for name, us, _ in lines[index + 1 :]:
+        modules[name] = us
+    return modules
+
+
+def measure(backend):
+    """Microseconds config.py and its widgets took, and the modules imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER, backend, CONFIG_DIR],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"{backend}: importing config.py failed\n{result.stderr[-2000:]}")
+    modules = parse(result.stderr)
+    modules[BUILD] = int(result.stdout.split()[-1])
+    return modules["config"] + modules[BUILD], modules
+
+
+def main(runs=3):
+    results = {}
+    for backend in BACKENDS:
+        measured = [measure(backend) for _ in range(runs)]
+        totals = [total for total, _ in measured]
+        results[backend] = measured[totals.index(sorted(totals)[runs // 2])][1]
+        print(
+            f"{backend}: {statistics.median(totals) / 1e3:.1f}ms"
+            f" in {len(results[backend]) - 1} modules"
+        )
+    for backend, modules in results.items():
+        print(f"\nHeaviest on {backend}:")
+        heaviest = sorted(modules.items(), key=lambda m: m[1], reverse=True)
+        for name, us in heaviest[:TOP]:
+            print(f"  {us / 1e3:8.1f}ms  {name}")
+    for backend, other in (BACKENDS, BACKENDS[::-1]):
+        only = results[backend].keys() - results[other].keys()
+        print(f"\nOnly on {backend}: {len(only)} modules")
+        for name in sorted(only, key=results[backend].get)[-TOP:]:
+            print(f"  {results[backend][name] / 1e3:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,111 @@
+"""Directory watches through the kernel's inotify, read on the asyncio loop.
+
+Only libc is needed, through ctypes. Where inotify isn't available,
+``has_inotify`` is False and callers check directory mtimes instead.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1
+    has_inotify = True
+except (OSError, AttributeError):
+    has_inotify = False
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Entries added, removed, renamed, rewritten or made (non-)executable
+CHANGES = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT = struct.Struct("iIII")
+
+
+class DirectoryWatcher:
+    """Call ``callback`` with the set of watched directories that changed.
+
+    Events read together are reported together. After the kernel's queue
+    overflowed, ``callback`` gets None: anything may have changed.
+    """
+
+    def __init__(self, callback, mask=CHANGES):
+        self.callback = callback
+        self.mask = mask
+        self._fd = None
+        self._paths = {}
+
+    def start(self):
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._read)
+
+    def stop(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self._paths.clear()
+
+    @property
+    def watching(self):
+        return set(self._paths.values())
+
+    def watch(self, paths):
+        """Watch exactly ``paths``, adding and removing watches as needed"""
+        paths = set(paths)
+        for wd, path in list(self._paths.items()):
+            if path not in paths:
+                _libc.inotify_rm_watch(self._fd, wd)
+                del self._paths[wd]
+        for path in paths - self.watching:
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask)
+            if wd >= 0:
+                self._paths[wd] = path
+
+    def _read(self):
+        changed = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size + length
+                overflow |= bool(mask & IN_Q_OVERFLOW)
+                path = self._paths.get(wd)
+                if path is not None:
+                    changed.add(path)
+                if mask & IN_IGNORED:
+                    # The directory is gone, its watch with it
+                    self._paths.pop(wd, None)
+        if changed or overflow:
+            self.callback(None if overflow else changed)
@@ -0,0 +1,94 @@
+import asyncio
+from asyncio.subprocess import DEVNULL
+
+try:
+    from dbus_next import Message, Variant
+    from dbus_next.aio import MessageBus
+
+    has_dbus = True
+except ImportError:
+    has_dbus = False
+
+URGENCY = {"low": 0, "normal": 1, "critical": 2}
+
+
+class Notifier:
+    """Send desktop notifications over one session bus connection.
+
+    Notifications with the same ``tag`` replace each other, through dunst's
+    stack tag and the notification id the server returns. Without dbus-next
+    this falls back to spawning dunstify.
+    """
+
+    def __init__(self, app_name="qtile"):
+        self.app_name = app_name
+        self._bus = None
+        self._ids = {}
+
+    async def _connect(self):
+        if self._bus is None or not self._bus.connected:
+            self._bus = await MessageBus().connect()
+        return self._bus
+
+    async def send(
+        self,
+        summary,
+        body="",
+        icon="",
+        tag=None,
+        urgency="low",
+        value=None,
+        timeout=-1,
+    ):
+        """Show a notification, ``timeout`` in ms or -1 for the server's"""
+        if not has_dbus:
+            await self._spawn(summary, body, icon, tag, urgency, value, timeout)
+            return
+        hints = {"urgency": Variant("y", URGENCY[urgency])}
+        if tag is not None:
+            hints["x-dunst-stack-tag"] = Variant("s", tag)
+        if value is not None:
+            hints["value"] = Variant("i", value)
+        bus = await self._connect()
+        reply = await bus.call(
+            Message(
+                destination="org.freedesktop.Notifications",
+                path="/org/freedesktop/Notifications",
+                interface="org.freedesktop.Notifications",
+                member="Notify",
+                signature="susssasa{sv}i",
+                body=[
+                    self.app_name,
+                    self._ids.get(tag, 0),
+                    icon,
+                    summary,
+                    body,
+                    [],
+                    hints,
+                    timeout,
+                ],
+            )
+        )
+        if tag is not None and reply.body:
+            self._ids[tag] = reply.body[0]
+
+    async def _spawn(self, summary, body, icon, tag, urgency, value, timeout):
+        args = ["dunstify", "-u", urgency, "-a", self.app_name, "-t", str(timeout)]
+        if icon:
+            args += ["-i", icon]
+        if tag is not None:
+            args += ["-h", f"string:x-dunst-stack-tag:{tag}"]
+        if value is not None:
+            args += ["-h", f"int:value:{value}"]
+        args += [summary, body] if body else [summary]
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=DEVNULL, stderr=DEVNULL
+        )
+        await proc.wait()
+
+    def notify(self, *args, **kwargs):
+        """Fire and forget ``send()`` on the running loop"""
+        return asyncio.get_running_loop().create_task(self.send(*args, **kwargs))
+
+
+notifier = Notifier()
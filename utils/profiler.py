@@ -0,0 +1,299 @@
+"""Timing of config.py evaluation, on every load and reload.
+
+With QTILE_PROFILE_CONFIG set in qtile's environment, each evaluation of
+config.py records wall time and allocations for every fold-marked section,
+every top-level import and every widget constructed, and writes them to
+~/.cache/qtile:
+
+    config-profile.json     the last evaluation
+    config-profile.folded   the same as stacks for flamegraph.pl/speedscope
+    config-profile.jsonl    one line per evaluation, to compare over time
+
+Allocations are the bytes tracemalloc sees allocated and still alive at
+the end of each. Tracing slows evaluation down, so the times are best
+compared with each other rather than with an unprofiled start.
+
+Widgets deferred with utils/deferred.py are imported and built when their
+bar is configured, after config.py has been evaluated. ``build()`` times
+them into the last report as the "Deferred widgets" section, so the
+report still covers what startup pays for them.
+
+Run as a script, it compares the last evaluation with the median of the
+ones before it, section by section.
+"""
+
+import builtins
+import functools
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ENV = "QTILE_PROFILE_CONFIG"
+DEFERRED = "Deferred widgets"
+REPORT_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "qtile"
+)
+# Evaluations in the history the last one is compared against
+BASELINE = 10
+
+
+def _since(start):
+    return round((time.perf_counter() - start) * 1e3, 3)
+
+
+class ConfigProfiler:
+    """Sections, imports and widget constructors of one config evaluation.
+
+    ``start()`` at the top of config.py installs an import hook for the
+    config's own imports and wraps widget ``__init__``s, ``section()``
+    starts the next section where a fold marker is and ``finish()`` at the
+    end removes the hooks and writes the report. All three do nothing
+    unless QTILE_PROFILE_CONFIG is set.
+    """
+
+    def __init__(self, report_dir=REPORT_DIR):
+        self.report_dir = report_dir
+        self.enabled = False
+        self.loads = 0
+        self._import = None
+        self._wrapped = []
+        self._widget_base = None
+        self._report = None
+        self._amended = False
+
+    def start(self):
+        self._uninstall()
+        self._report = None
+        self.enabled = bool(os.environ.get(ENV))
+        if not self.enabled:
+            return
+        self.loads += 1
+        self.sections = []
+        self.imports = []
+        self.widgets = []
+        self._current = None
+        self._constructing = set()
+        self._globals = sys._getframe(1).f_globals
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        self.section("Imports")
+
+    @staticmethod
+    def _memory():
+        return tracemalloc.get_traced_memory()[0]
+
+    def _measure(self, start, memory):
+        return {"ms": _since(start), "allocated": self._memory() - memory}
+
+    def section(self, name):
+        """End the current section and start ``name``"""
+        if not self.enabled:
+            return
+        if self._current is not None:
+            label, start, memory = self._current
+            self.sections.append({"name": label, **self._measure(start, memory)})
+        if name not in ("Imports", None) and self._widget_base is None:
+            # libqtile's widgets are imported by then
+            self._wrap_widgets()
+        self._current = (name, time.perf_counter(), self._memory())
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if globals is not self._globals:
+            return self._import(name, globals, locals, fromlist, level)
+        start, memory = time.perf_counter(), self._memory()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            label = f"{name}: {', '.join(fromlist)}" if fromlist else name
+            self.imports.append({"name": label, **self._measure(start, memory)})
+
+    def _wrap_widgets(self):
+        try:
+            from libqtile.widget.base import _Widget
+        except ImportError:
+            return
+        self._widget_base = _Widget
+        pending = [_Widget]
+        while pending:
+            cls = pending.pop()
+            self._wrap(cls)
+            pending.extend(cls.__subclasses__())
+        profiler = self
+
+        def __init_subclass__(cls, **kwargs):
+            super(_Widget, cls).__init_subclass__(**kwargs)
+            profiler._wrap(cls)
+
+        _Widget.__init_subclass__ = classmethod(__init_subclass__)
+
+    def _wrap(self, cls):
+        init = cls.__init__
+        if getattr(init, "_profiled", False) and "__init__" in cls.__dict__:
+            return
+        profiler = self
+        section = lambda: profiler._current[0] if profiler._current else None
+
+        @functools.wraps(init)
+        def __init__(widget, *args, **kwargs):
+            # Superclass __init__s and widgets made by other widgets are part
+            # of the outermost constructor
+            if profiler._constructing or not profiler.enabled:
+                return init(widget, *args, **kwargs)
+            profiler._constructing.add(id(widget))
+            start, memory = time.perf_counter(), profiler._memory()
+            try:
+                return init(widget, *args, **kwargs)
+            finally:
+                profiler._constructing.discard(id(widget))
+                profiler.widgets.append(
+                    {
+                        "name": type(widget).__name__,
+                        "section": section(),
+                        **profiler._measure(start, memory),
+                    }
+                )
+
+        __init__._profiled = True
+        self._wrapped.append((cls, cls.__dict__.get("__init__")))
+        cls.__init__ = __init__
+
+    def _uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+        for cls, init in reversed(self._wrapped):
+            if init is None:
+                del cls.__init__
+            else:
+                cls.__init__ = init
+        self._wrapped = []
+        if self._widget_base is not None:
+            del self._widget_base.__init_subclass__
+            self._widget_base = None
+
+    def finish(self):
+        """End the last section, remove the hooks and write the report"""
+        if not self.enabled:
+            return
+        self.section(None)
+        total = _since(self._started)
+        self._uninstall()
+        if self._tracing:
+            tracemalloc.stop()
+        self.enabled = False
+        report = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "load": self.loads,
+            "ms": total,
+            "sections": self.sections,
+            "imports": self.imports,
+            "widgets": self.widgets,
+        }
+        path = self.write(report)
+        self._report = report
+        from libqtile.log_utils import logger
+
+        logger.info("config.py evaluated in %.0fms, profile in %s", total, path)
+
+    def build(self, deferred):
+        """Build ``deferred`` and add the time it took to the last report"""
+        report = self._report
+        if report is None or deferred._built is not None:
+            return deferred.build()
+        start = time.perf_counter()
+        built = deferred.build()
+        ms = _since(start)
+        if not report["sections"] or report["sections"][-1]["name"] != DEFERRED:
+            report["sections"].append({"name": DEFERRED, "ms": 0, "allocated": None})
+        section = report["sections"][-1]
+        section["ms"] = round(section["ms"] + ms, 3)
+        report["ms"] = round(report["ms"] + ms, 3)
+        report["widgets"].append(
+            {"name": deferred.name, "section": DEFERRED, "ms": ms, "allocated": None}
+        )
+        self._amended = True
+        return built
+
+    def amend(self):
+        """Rewrite the last report with the deferred widgets built since"""
+        if self._amended:
+            self.write(self._report, replace=True)
+            self._amended = False
+
+    def write(self, report, replace=False):
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, "config-profile.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(self.report_dir, "config-profile.folded"), "w") as f:
+            f.writelines(line + "\n" for line in folded(report))
+        history = os.path.join(self.report_dir, "config-profile.jsonl")
+        lines = []
+        if replace:
+            with open(history) as f:
+                # Every line but the last, which is this report
+                lines = f.readlines()[:-1]
+        with open(history, "w" if replace else "a") as f:
+            f.writelines([*lines, json.dumps(report) + "\n"])
+        return path
+
+
+def folded(report):
+    """Collapsed stacks in microseconds, children split off their section"""
+    children = {}
+    for item in report["imports"]:
+        children.setdefault("Imports", []).append(("import " + item["name"], item))
+    for item in report["widgets"]:
+        children.setdefault(item["section"], []).append((item["name"], item))
+    lines = []
+    for section in report["sections"]:
+        nested = children.get(section["name"], [])
+        # Nested widgets are part of the widget constructing them
+        own = section["ms"] - sum(item["ms"] for _, item in nested)
+        lines.append(f"config.py;{section['name']} {max(round(own * 1e3), 0)}")
+        lines.extend(
+            f"config.py;{section['name']};{name} {round(item['ms'] * 1e3)}"
+            for name, item in nested
+        )
+    return lines
+
+
+def compare(history, baseline=BASELINE):
+    """The last evaluation's sections against the median of earlier ones"""
+    last, earlier = history[-1], history[-baseline - 1 : -1]
+    rows = []
+    for section in last["sections"]:
+        times = [
+            s["ms"]
+            for report in earlier
+            for s in report["sections"]
+            if s["name"] == section["name"]
+        ]
+        median = statistics.median(times) if times else None
+        rows.append((section["name"], section["ms"], median))
+    return rows
+
+
+profile = ConfigProfiler()
+
+
+if __name__ == "__main__":
+    try:
+        with open(os.path.join(REPORT_DIR, "config-profile.jsonl")) as f:
+            history = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        history = []
+    if not history:
+        sys.exit(f"No profiles yet, start qtile with {ENV}=1")
+    for name, ms, median in compare(history):
+        change = f"{ms - median:+.1f}ms" if median is not None else "new"
+        print(f"{name:<32}{ms:>10.1f}ms {change:>10}")
+    print(f"{'Total':<32}{history[-1]['ms']:>10.1f}ms")
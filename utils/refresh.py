@@ -0,0 +1,201 @@
+import asyncio
+import os
+import shlex
+import time
+from collections import deque
+from pathlib import Path
+
+from utils.deferred import Deferred
+
+try:
+    import xcffib.screensaver
+
+    has_screensaver = True
+except ImportError:
+    has_screensaver = False
+
+POWER_SUPPLY = Path("/sys/class/power_supply")
+LOCKERS = {"i3lock", "betterlockscreen"}
+LOCK_PIDFILE = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "qtile-lock.pid")
+# How often the session state is probed, in seconds
+PROBE_INTERVAL = 10
+# Seconds without input after which the session counts as idle
+IDLE_AFTER = 300
+# Redraws requested within one frame are drawn together
+FRAME = 1 / 30
+
+
+class RefreshPolicy:
+    """How much a widget's intervals are stretched in each session state.
+
+    Each factor multiplies the widget's configured intervals while that state
+    holds; when several hold, the largest factor wins. ``attrs`` names the
+    interval attributes to stretch. ``idle`` and ``blanked`` are read from
+    the X screensaver extension, so on Wayland they never apply.
+    """
+
+    def __init__(
+        self,
+        idle=4,
+        locked=30,
+        blanked=30,
+        battery=2,
+        attrs=("update_interval",),
+    ):
+        self.factors = {
+            "idle": idle,
+            "locked": locked,
+            "blanked": blanked,
+            "battery": battery,
+        }
+        self.attrs = attrs
+
+    def factor(self, state):
+        return max(
+            [factor for name, factor in self.factors.items() if state[name]],
+            default=1,
+        )
+
+
+def on_battery():
+    online = None
+    for supply in POWER_SUPPLY.glob("*"):
+        try:
+            if (supply / "type").read_text().strip() == "Mains":
+                online = online or (supply / "online").read_text().strip() == "1"
+        except OSError:
+            continue
+    # Desktops have no mains supply to report and are never on battery
+    return online is False
+
+
+def lock_command(command):
+    """``command`` run so that ``locker_running`` knows its pid"""
+    script = f"echo $$ > {shlex.quote(LOCK_PIDFILE)}; exec {command}"
+    return shlex.join(["sh", "-c", script])
+
+
+def locker_running():
+    """Whether the locker last started through ``lock_command`` still runs"""
+    try:
+        with open(LOCK_PIDFILE) as f:
+            pid = int(f.read())
+        with open(f"/proc/{pid}/comm") as f:
+            name = f.read().strip()
+    except (OSError, ValueError):
+        return False
+    # The pid may have been reused since
+    return name in {locker[:15] for locker in LOCKERS}
+
+
+def x11_idle(qtile):
+    """Return seconds since the last input and whether the screen is blanked.
+
+    Only X11 has the screensaver extension, elsewhere this is ``(0, False)``.
+    """
+    if not has_screensaver or qtile.core.name != "x11":
+        return 0, False
+    conn = qtile.core.conn
+    ext = conn.conn(xcffib.screensaver.key)
+    info = ext.QueryInfo(conn.default_screen.root.wid).reply()
+    return info.ms_since_user_input / 1000, info.state == xcffib.screensaver.State.On
+
+
+class RefreshScheduler:
+    """Stretch widget refresh intervals while nobody is looking.
+
+    Registered widgets have the intervals named by their policy scaled from
+    their configured values whenever the session becomes idle, locked,
+    blanked or runs on battery, and restored afterwards. Widget updates and
+    bar draws are counted to report wakeups per minute.
+    """
+
+    def __init__(self):
+        self.state = dict.fromkeys(("idle", "locked", "blanked", "battery"), False)
+        self._widgets = {}
+        self._wakeups = deque()
+        self._draws = 0
+        self._qtile = None
+        self._handle = None
+
+    def policy(self, widget, policy=None, **factors):
+        """Put ``widget`` under ``policy``, or one built from ``factors``"""
+        policy = policy or RefreshPolicy(**factors)
+        if isinstance(widget, Deferred):
+            widget.when_built(lambda built: self.policy(built, policy))
+            return widget
+        base = {attr: getattr(widget, attr) for attr in policy.attrs}
+        self._widgets[widget] = (policy, base)
+        self._count_updates(widget)
+        return widget
+
+    def forget(self, widget):
+        """Stop stretching the intervals of a widget that's gone"""
+        self._widgets.pop(widget, None)
+
+    def _count_updates(self, widget):
+        update = widget.update
+
+        def counted(*args, **kwargs):
+            self.wakeup()
+            return update(*args, **kwargs)
+
+        widget.update = counted
+
+    def wakeup(self):
+        now = time.monotonic()
+        self._wakeups.append(now)
+        while self._wakeups[0] < now - 60:
+            self._wakeups.popleft()
+
+    def drawn(self):
+        self._draws += 1
+        self.wakeup()
+
+    def start(self, qtile):
+        if self._handle is None:
+            self._qtile = qtile
+            self._handle = asyncio.get_running_loop().call_soon(self._probe)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _probe(self):
+        idle, blanked = x11_idle(self._qtile)
+        self.update_state(
+            idle=idle >= IDLE_AFTER,
+            blanked=blanked,
+            locked=locker_running(),
+            battery=on_battery(),
+        )
+        self._handle = asyncio.get_running_loop().call_later(
+            PROBE_INTERVAL, self._probe
+        )
+
+    def update_state(self, **state):
+        if all(self.state[name] == value for name, value in state.items()):
+            return
+        self.state.update(state)
+        for widget, (policy, base) in self._widgets.items():
+            factor = policy.factor(self.state)
+            for attr, value in base.items():
+                setattr(widget, attr, value * factor)
+            if hasattr(widget, "interval_changed"):
+                widget.interval_changed()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "wakeups_per_minute": sum(1 for t in self._wakeups if t >= now - 60),
+            "draws": self._draws,
+            "state": dict(self.state),
+        }
+
+    def frame_delay(self):
+        """Seconds until the next frame boundary"""
+        return FRAME - time.monotonic() % FRAME
+
+
+scheduler = RefreshScheduler()
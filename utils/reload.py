@@ -0,0 +1,411 @@
+"""Reload config.py in place, rebuilding only what changed.
+
+The new config is evaluated and every key, group, layout, bar and widget is
+fingerprinted: its type and the arguments it was built from, with the code
+of functions and config-defined classes. What matches the running config is
+kept, keys taking the new config's commands so that they call its objects
+rather than the previous module's. Changed keys are regrabbed, groups whose
+layouts changed are laid out again and changed widgets are swapped in their
+bar, so the others keep their state and the bar doesn't flicker.
+
+Changes that touch everything, and anything this can't swap in place, fall
+back to qtile's own reload.
+"""
+
+import sys
+import time
+import types
+from pathlib import Path
+
+from libqtile import bar, hook
+from libqtile.config import ScratchPad
+from libqtile.configurable import Configurable
+from libqtile.confreader import Config
+from libqtile.lazy import LazyCall
+from libqtile.log_utils import logger
+from libqtile.widget.base import _Widget
+
+from utils.deferred import Deferred
+from utils.notify import notifier
+
+# Settings that every widget, window or binding depends on
+REBUILD_ALL = (
+    "mouse",
+    "widget_defaults",
+    "extension_defaults",
+    "floating_layout",
+    "wl_input_rules",
+)
+# Reconciled object by object rather than replaced
+RECONCILED = ("keys", "groups", "layouts", "screens")
+BAR_POSITIONS = ("top", "bottom", "left", "right")
+# Fired after an incremental reload, for @hook.subscribe.user("config_reloaded")
+RELOADED = "config_reloaded"
+
+
+class Fingerprint:
+    """Hashable summaries of what config objects were built from.
+
+    Functions and the classes defined in ``module`` are summarised by their
+    code, so editing a method or a function bound to a key counts as a
+    change. Functions also include the plain values of the globals they
+    read, like ``volume_step``. Deferred objects and what was built from
+    them compare by class and arguments, so identical ones needn't be built.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self._active = set()
+
+    def __call__(self, obj):
+        if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+            return obj
+        if id(obj) in self._active:
+            return "<cycle>"
+        self._active.add(id(obj))
+        try:
+            return self._summary(obj)
+        finally:
+            self._active.discard(id(obj))
+
+    def _summary(self, obj):
+        if isinstance(obj, (list, tuple)):
+            return (type(obj).__name__, tuple(map(self, obj)))
+        if isinstance(obj, (set, frozenset)):
+            return ("set", tuple(sorted(map(repr, map(self, obj)))))
+        if isinstance(obj, dict):
+            return ("dict", tuple((self(k), self(v)) for k, v in obj.items()))
+        if isinstance(obj, types.MethodType):
+            return ("method", self(obj.__func__), _name(type(obj.__self__)))
+        if isinstance(obj, types.FunctionType):
+            return self._function(obj)
+        if isinstance(obj, types.CodeType):
+            return ("code", obj.co_code, self(obj.co_consts), obj.co_names)
+        if isinstance(obj, type):
+            return self._class(obj)
+        if isinstance(obj, Deferred):
+            return ("deferred", obj.module, obj.name, self(obj.args), self(obj.kwargs))
+        if isinstance(getattr(obj, "_deferred", None), Deferred):
+            # Built from a deferred one, compare what it was built from
+            return self(obj._deferred)
+        if isinstance(obj, LazyCall):
+            rest = {k: v for k, v in vars(obj).items() if k != "_call"}
+            call = (self(obj.selectors), obj.name, self(obj.args), self(obj.kwargs))
+            return ("lazy", call, self(rest))
+        if isinstance(obj, Configurable):
+            return self._configurable(obj)
+        if isinstance(obj, bar.Gap):
+            return ("gap", obj.size)
+        if hasattr(obj, "__dict__"):
+            return (self(type(obj)), self(vars(obj)))
+        text = repr(obj)
+        # Default reprs carry the address and say nothing about the value
+        return (_name(type(obj)), None if " at 0x" in text else text)
+
+    def _function(self, func):
+        plain = (bool, int, float, str)
+        used = tuple(
+            (name, func.__globals__[name])
+            for name in func.__code__.co_names
+            if isinstance(func.__globals__.get(name), plain)
+        )
+        return (
+            "function",
+            func.__module__,
+            func.__qualname__,
+            self(func.__code__),
+            self(func.__defaults__),
+            self(func.__kwdefaults__),
+            used,
+        )
+
+    def _class(self, cls):
+        if cls.__module__ != self.module:
+            return ("class", _name(cls))
+        own = tuple((k, self(v)) for k, v in vars(cls).items() if callable(v))
+        return ("class", _name(cls), tuple(map(self, cls.__bases__)), own)
+
+    def _configurable(self, obj):
+        """Built from their class and the keyword arguments they were given.
+
+        Widgets and bars change once configured, only what they were built
+        from counts. Other configurables, like layout templates and
+        dropdowns, stay as built and their plain attributes count too.
+        """
+        summary = (self(type(obj)), self(obj._user_config))
+        if isinstance(obj, _Widget):
+            # Passed positionally, so not part of _user_config
+            static = obj.length if obj.length_type == bar.STATIC else None
+            return summary + (obj.length_type, static)
+        if isinstance(obj, bar.Gap):
+            return summary + (getattr(obj, "initial_size", obj.size),)
+        plain = (bool, int, float, str)
+        attrs = tuple(
+            (k, v)
+            for k, v in vars(obj).items()
+            if isinstance(v, plain) and k not in obj._user_config
+        )
+        return summary + (attrs,)
+
+
+def _name(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _subscriptions():
+    """Hook functions by event, from the registry of any qtile version"""
+    subscriptions = hook.subscriptions
+    if hasattr(hook, "qtile_hooks"):
+        # Keyed by registry since qtile 0.22
+        subscriptions = subscriptions.get(hook.qtile_hooks.name, {})
+    return {event: list(funcs) for event, funcs in subscriptions.items()}
+
+
+def _unsubscribe(subscriptions):
+    for event, funcs in subscriptions.items():
+        for func in funcs:
+            if event.startswith("user_"):
+                hook.unsubscribe.user(event[len("user_") :])(func)
+            else:
+                getattr(hook.unsubscribe, event)(func)
+
+
+class IncrementalReload:
+    """Reload the config of a running qtile, keeping what didn't change.
+
+    ``discard`` is called with each widget the new config built that isn't
+    used, because an identical one is already running.
+    """
+
+    def __init__(self, discard=None):
+        self.discard = discard
+        self.reloads = []
+
+    def __call__(self, qtile):
+        start = time.perf_counter()
+        name = Path(qtile.config.file_path).stem
+        before = _subscriptions()
+        module = sys.modules.get(name)
+        old_globals = dict(vars(module)) if module is not None else {}
+        try:
+            new = Config(qtile.config.file_path)
+            new.load()
+            new.validate()
+        except Exception as e:
+            logger.exception("Configuration error:")
+            _unsubscribe(self._added(before))
+            notifier.notify("Configuration error", str(e), tag="qtileconfig")
+            return None
+
+        fingerprint = Fingerprint(name)
+        reason = self._needs_full_reload(qtile, new, fingerprint)
+        if reason is None:
+            # Hooks of the old config, they're subscribed again by the new one
+            stale = self._stale(before, name, old_globals, vars(sys.modules[name]))
+            _unsubscribe(stale)
+            try:
+                rebuilt = self._apply(qtile, new, fingerprint)
+            except Exception:
+                logger.exception("Incremental reload failed, reloading fully")
+                reason = "failed"
+        if reason is not None:
+            _unsubscribe(self._added(before))
+            qtile.reload_config()
+            rebuilt = {"full": reason}
+        elif _subscriptions().get(f"user_{RELOADED}"):
+            # qtile only knows a user hook once something subscribed to it
+            hook.fire(f"user_{RELOADED}")
+
+        ms = (time.perf_counter() - start) * 1e3
+        self.reloads.append((ms, rebuilt))
+        summary = ", ".join(f"{k}: {v}" for k, v in rebuilt.items()) or "nothing"
+        logger.info("Config reloaded in %.0fms, rebuilt %s", ms, summary)
+        notifier.notify(
+            "Configuration Reloaded!", f"{ms:.0f}ms, {summary}", tag="qtileconfig"
+        )
+        return rebuilt
+
+    @staticmethod
+    def _added(before):
+        added = {}
+        for event, funcs in _subscriptions().items():
+            old = before.get(event, [])
+            added[event] = [f for f in funcs if not any(f is o for o in old)]
+        return added
+
+    @staticmethod
+    def _stale(before, name, old_globals, new_globals):
+        """Hooks subscribed by the old config or by helpers it replaced.
+
+        Widgets and layouts are left alone, they may be kept, and finalizing
+        the ones that aren't unsubscribes them.
+        """
+        replaced = {
+            id(value)
+            for key, value in old_globals.items()
+            if new_globals.get(key) is not value and not isinstance(value, Configurable)
+        }
+
+        def owned(func):
+            owner = getattr(func, "__self__", None)
+            if owner is not None:
+                return id(owner) in replaced
+            return getattr(func, "__module__", None) == name
+
+        return {event: list(filter(owned, funcs)) for event, funcs in before.items()}
+
+    def _needs_full_reload(self, qtile, new, fingerprint):
+        if qtile.chords_stack:
+            return "inside a key chord"
+        for setting in REBUILD_ALL:
+            old = getattr(qtile.config, setting, None)
+            if fingerprint(old) != fingerprint(getattr(new, setting, None)):
+                return setting
+        scratchpads = [
+            [fingerprint(g) for g in config.groups if isinstance(g, ScratchPad)]
+            for config in (qtile.config, new)
+        ]
+        if scratchpads[0] != scratchpads[1]:
+            return "scratchpads"
+        if len(new.screens) != len(qtile.config.screens):
+            return "screens"
+        for old, screen in zip(qtile.config.screens, new.screens):
+            for position in BAR_POSITIONS:
+                old_bar, new_bar = getattr(old, position), getattr(screen, position)
+                if fingerprint(old_bar) != fingerprint(new_bar):
+                    return "bars"
+                widgets = [
+                    len(getattr(b, "widgets", None) or ()) for b in (old_bar, new_bar)
+                ]
+                if widgets[0] != widgets[1]:
+                    return "bars"
+        return None
+
+    def _apply(self, qtile, new, fingerprint):
+        rebuilt = {}
+        keys = self._keys(qtile, new.keys, fingerprint)
+        if keys[1]:
+            rebuilt["keys"] = keys[1]
+        groups = self._groups(qtile, new, fingerprint)
+        if groups:
+            rebuilt["groups"] = " ".join(groups)
+        widgets = self._widgets(qtile, new, fingerprint)
+        if widgets:
+            rebuilt["widgets"] = " ".join(widgets)
+
+        # Plain settings are read from the config as they're needed
+        for setting, value in vars(new).items():
+            if setting not in RECONCILED and not setting.startswith("_"):
+                setattr(qtile.config, setting, value)
+        qtile.config.keys = keys[0]
+        qtile.config.layouts = new.layouts
+        qtile.config.groups = new.groups
+        return rebuilt
+
+    @staticmethod
+    def _keys(qtile, keys, fingerprint):
+        """Regrab changed keys, return the keys to keep and how many changed.
+
+        A kept key stays the object qtile has grabbed, but takes the new
+        key's attributes: its commands refer to the new module's functions,
+        and they to its helpers, which the fingerprint doesn't cover.
+        """
+        running = {fingerprint(key): key for key in qtile.config.keys}
+        kept, added = [], []
+        for key in keys:
+            old = running.pop(fingerprint(key), None)
+            if old is None:
+                added.append(key)
+                kept.append(key)
+            else:
+                vars(old).update(vars(key))
+                kept.append(old)
+        # Ungrab first, a changed key is usually grabbed with the same keysym
+        for key in running.values():
+            qtile.ungrab_key(key)
+        for key in added:
+            qtile.grab_key(key)
+        return kept, len(added) + len(running)
+
+    def _groups(self, qtile, new, fingerprint):
+        """Add, delete, relabel and lay out again the groups that changed"""
+        old_groups = {g.name: g for g in qtile.config.groups}
+        new_groups = {g.name: g for g in new.groups}
+        changed = []
+        for name in old_groups.keys() - new_groups.keys():
+            qtile.delete_group(name)
+            changed.append(f"-{name}")
+        for group in new.groups:
+            if isinstance(group, ScratchPad):
+                continue
+            if group.name not in old_groups:
+                qtile.add_group(
+                    group.name,
+                    layout=group.layout,
+                    layouts=group.layouts or new.layouts,
+                    label=group.label,
+                )
+                changed.append(f"+{group.name}")
+                continue
+            running = qtile.groups_map[group.name]
+            old = old_groups[group.name]
+            if old.label != group.label:
+                running.label = group.label
+            old_layouts = old.layouts or qtile.config.layouts
+            new_layouts = group.layouts or new.layouts
+            if fingerprint(old_layouts) != fingerprint(new_layouts):
+                self._relayout(running, new_layouts)
+                changed.append(group.name)
+        return changed
+
+    @staticmethod
+    def _relayout(group, layouts):
+        current = group.layout.name
+        for layout in group.layouts:
+            layout.finalize()
+        group.layouts = [layout.clone(group) for layout in layouts]
+        names = [layout.name for layout in group.layouts]
+        group.current_layout = names.index(current) if current in names else 0
+        for window in group.windows:
+            if not window.floating:
+                for layout in group.layouts:
+                    # Called add before qtile 0.23
+                    (getattr(layout, "add_client", None) or layout.add)(window)
+        if group.current_window is not None:
+            group.layout.focus(group.current_window)
+        if group.screen is not None:
+            group.layout_all()
+
+    def _widgets(self, qtile, new, fingerprint):
+        """Swap the widgets that changed into their running bars"""
+        changed = []
+        for old, screen in zip(qtile.config.screens, new.screens):
+            for position in BAR_POSITIONS:
+                running, built = getattr(old, position), getattr(screen, position)
+                if not isinstance(running, bar.Bar):
+                    continue
+                swapped = False
+                for index, widget in enumerate(built.widgets):
+                    current = running.widgets[index]
+                    if fingerprint(current) == fingerprint(widget):
+                        if self.discard is not None:
+                            self.discard(widget)
+                        continue
+                    current.finalize()
+                    qtile.widgets_map.pop(current.name, None)
+                    if self.discard is not None:
+                        self.discard(current)
+                    if isinstance(widget, Deferred):
+                        widget = widget.build()
+                    running.widgets[index] = widget
+                    if running._configure_widget(widget):
+                        qtile.register_widget(widget)
+                    changed.append(widget.name)
+                    swapped = True
+                if swapped:
+                    running.draw()
+        return changed
+
+    def stats(self):
+        """How long the reloads took and what they rebuilt"""
+        return [{"ms": ms, **rebuilt} for ms, rebuilt in self.reloads]
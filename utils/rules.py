@@ -0,0 +1,160 @@
+import random
+import time
+
+# Rules using only these properties depend on nothing but the cache key
+STATIC_PROPERTIES = {"wm_class", "title"}
+CACHE_SIZE = 4096
+
+
+def _rules(match):
+    return getattr(match, "_rules", {})
+
+
+class RuleIndex:
+    """First-match lookup over an ordered list of ``(Match, value)`` rules.
+
+    Rules that are nothing but an exact ``wm_class`` string are hashed on it.
+    Other rules matching only on class and title are checked in order, and
+    the outcome of both is cached per ``(wm_class, title)``. Rules looking at
+    anything else (window type, role, pid, functions) can't be cached and are
+    checked on every lookup, but only when they'd take precedence.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.by_class = {}
+        self.static = []
+        self.dynamic = []
+        self._values = []
+        self._cache = {}
+        for priority, (match, value) in enumerate(self.rules):
+            self._values.append(value)
+            props = _rules(match)
+            wm_class = props.get("wm_class")
+            if set(props) == {"wm_class"} and isinstance(wm_class, str):
+                self.by_class.setdefault(wm_class, priority)
+            elif props and set(props) <= STATIC_PROPERTIES:
+                self.static.append((priority, match))
+            else:
+                self.dynamic.append((priority, match))
+
+    def _static_lookup(self, client, wm_class):
+        best = min(
+            (self.by_class[c] for c in wm_class if c in self.by_class),
+            default=len(self._values),
+        )
+        for priority, match in self.static:
+            if priority >= best:
+                break
+            if match.compare(client):
+                return priority
+        return best
+
+    def priority(self, client):
+        """Return the priority of the first rule matching ``client``"""
+        wm_class = tuple(client.get_wm_class() or ())
+        key = (wm_class, client.name)
+        best = self._cache.get(key)
+        if best is None:
+            if len(self._cache) >= CACHE_SIZE:
+                # Titles change a lot, don't let them pile up
+                self._cache.clear()
+            best = self._cache[key] = self._static_lookup(client, wm_class)
+        for priority, match in self.dynamic:
+            if priority >= best:
+                break
+            if match.compare(client):
+                return priority
+        return best
+
+    def lookup(self, client, default=None):
+        priority = self.priority(client)
+        return self._values[priority] if priority < len(self._values) else default
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+class WindowRouter:
+    """Decide the group and floating state of new windows in one lookup each"""
+
+    def __init__(self, groups, float_rules):
+        self.groups = RuleIndex(
+            (match, group.name) for group in groups for match in group.matches or ()
+        )
+        self.floats = RuleIndex([(match, True) for match in float_rules])
+
+    def group_for(self, client):
+        return self.groups.lookup(client)
+
+    def floating(self, client):
+        return self.floats.lookup(client, False)
+
+
+class _Client:
+    def __init__(self, wm_class, name, wm_type="normal"):
+        self.wm_class = wm_class
+        self.name = name
+        self.wm_type = wm_type
+
+    def get_wm_class(self):
+        return self.wm_class
+
+    def get_wm_type(self):
+        return self.wm_type
+
+    def get_wm_role(self):
+        return None
+
+    def is_transient_for(self):
+        return None
+
+
+def _clients(router, count):
+    """Synthetic clients, a third of them using a class from the rules"""
+    classes = [
+        props["wm_class"]
+        for index in (router.groups, router.floats)
+        for match, _ in index.rules
+        if isinstance((props := _rules(match)).get("wm_class"), str)
+    ]
+    classes += [f"app{i}" for i in range(len(classes) * 2)]
+    titles = ["Library", "JetBrains Toolbox", "Mozilla Firefox", "~", "Untitled"]
+    rng = random.Random(0)
+    return [
+        _Client([wm_class.lower(), wm_class], rng.choice(titles))
+        for wm_class in (rng.choice(classes) for _ in range(count))
+    ]
+
+
+def _benchmark(router, count):
+    """Classify ``count`` clients with the index and with a linear scan"""
+    clients = _clients(router, count)
+
+    start = time.perf_counter()
+    linear = []
+    for client in clients:
+        group = next(
+            (name for match, name in router.groups.rules if match.compare(client)),
+            None,
+        )
+        floating = any(match.compare(client) for match, _ in router.floats.rules)
+        linear.append((group, floating))
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [(router.group_for(c), router.floating(c)) for c in clients]
+    indexed_time = time.perf_counter() - start
+    assert indexed == linear
+    return linear_time, indexed_time
+
+
+if __name__ == "__main__":
+    from config import router
+
+    count = 5000
+    linear, indexed = _benchmark(router, count)
+    print(
+        f"{count} clients: linear {linear * 1e3:.1f}ms, "
+        f"indexed {indexed * 1e3:.1f}ms"
+    )
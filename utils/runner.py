@@ -0,0 +1,191 @@
+"""Command runner over an index of the executables in $PATH.
+
+The executables of each $PATH directory are listed once and kept in
+~/.cache/qtile/path-index.json with the directory mtimes they were listed
+at, and inside qtile inotify marks directories as they change, so opening
+the menu lists nothing. Commands are offered by frecency: how often they
+were run, counting half once RECENCY more commands were run after them.
+
+``python3 -m utils.runner`` lists the commands in menu order, and with
+``--benchmark [COUNT]`` compares a synthetic $PATH against dmenu_path.
+"""
+
+import json
+import os
+import stat
+import sys
+
+from utils.dmenu import (
+    CACHE_DIR,
+    IndexedMenu,
+    Usage,
+    print_timings,
+    time_to_menu,
+    write_json,
+)
+
+INDEX = os.path.join(CACHE_DIR, "path-index.json")
+USAGE = os.path.join(CACHE_DIR, "run-usage.json")
+RECENCY = 50
+EXECUTABLE = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+
+
+def path_dirs():
+    return list(dict.fromkeys(d for d in os.environ.get("PATH", "").split(":") if d))
+
+
+def executables(directory):
+    """Names of the executable files in ``directory``, like ``stest -flx``"""
+    names = []
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mode & EXECUTABLE:
+                names.append(entry.name)
+        except OSError:
+            continue
+    return names
+
+
+class PathIndex:
+    """Executables of the $PATH directories, as ``dirs``: dir -> [mtime, names]"""
+
+    def __init__(self, path=None, cache=INDEX):
+        self.path = path or path_dirs()
+        self.cache = cache
+        self.dirs = {}
+        self.version = 0
+        self._names = None
+
+    def load(self):
+        """Read the cached index and bring it up to date"""
+        try:
+            with open(self.cache) as f:
+                self.dirs = json.load(f)["dirs"]
+        except (OSError, ValueError, KeyError):
+            pass
+        if self.refresh(self.changed()):
+            self.save()
+        return self
+
+    def changed(self):
+        """Directories whose mtime moved"""
+        return [d for d in self.path if self._changed(d)]
+
+    def watched(self):
+        return self.path
+
+    def polled(self):
+        """Directories that didn't exist, which inotify can't watch"""
+        return [d for d in self.path if self.dirs[d][0] is None]
+
+    def _changed(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        known = self.dirs.get(directory)
+        return (known[0] if known else False) != mtime
+
+    def refresh(self, dirs):
+        """List ``dirs`` again, returns whether anything changed"""
+        before = self.version
+        for directory in dirs:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                names = executables(directory)
+            except OSError:
+                mtime, names = None, []
+            if self.dirs.get(directory) != [mtime, names]:
+                self.dirs[directory] = [mtime, names]
+                self.version += 1
+        return self.version != before
+
+    def save(self):
+        write_json(self.cache, {"dirs": self.dirs})
+
+    def names(self):
+        """Every command name in $PATH, sorted"""
+        if self._names is None or self._names[0] != self.version:
+            names = set()
+            for directory in self.path:
+                known = self.dirs.get(directory)
+                if known:
+                    names.update(known[1])
+            self._names = (self.version, sorted(names))
+        return self._names[1]
+
+
+def ranked(names, usage):
+    """Recorded commands still in ``names``, by frecency, then ``names``"""
+    known = set(names)
+    scored = sorted(
+        (-usage.score(command), command)
+        for command in usage.counts
+        if command.split(maxsplit=1)[0] in known
+    )
+    frecent = [command for _, command in scored]
+    shown = set(frecent)
+    return frecent + [name for name in names if name not in shown]
+
+
+class Runner(IndexedMenu):
+    """Pick or type a command in dmenu and run it, from inside qtile"""
+
+    def __init__(self, prompt="Run ", lines=10, ignorecase=True, dmenu="dmenu -vi"):
+        super().__init__(prompt, lines, ignorecase, dmenu)
+
+    def load(self):
+        return PathIndex().load(), Usage(USAGE, RECENCY)
+
+    def entries(self):
+        return [(c, c) for c in ranked(self.index.names(), self.usage)]
+
+    def launch(self, qtile, choice, key):
+        # Typed commands may have arguments, like dmenu_run they go to the shell
+        qtile.spawn([os.environ.get("SHELL", "/bin/sh"), "-c", choice])
+        return choice
+
+
+def _benchmark(count):
+    import shutil
+    import subprocess
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = [os.path.join(tmp, f"bin{i}") for i in range(20)]
+        for i, directory in enumerate(path):
+            os.makedirs(directory)
+            for n in range(i, count, len(path)):
+                name = os.path.join(directory, f"cmd{n}")
+                with open(name, "w"):
+                    pass
+                os.chmod(name, 0o755 if n % 10 else 0o644)
+        usage = Usage(os.devnull, RECENCY)
+        for n in range(0, count, max(1, count // 500)):
+            usage.counts[f"cmd{n} --flag"] = [n % 7 + 1, usage.runs]
+            usage.runs += 1
+        cache = os.path.join(tmp, "index.json")
+        timings = time_to_menu(
+            lambda: PathIndex(path, cache).load(),
+            lambda index: "".join(f"{c}\n" for c in ranked(index.names(), usage)),
+        )
+        if shutil.which("dmenu_path"):
+            env = dict(os.environ, PATH=":".join(path))
+            env["XDG_CACHE_HOME"] = tmp
+            for run in ("dmenu_path cold", "dmenu_path warm"):
+                start = time.perf_counter()
+                subprocess.run(
+                    [shutil.which("dmenu_path")], env=env, capture_output=True
+                )
+                timings[run] = time.perf_counter() - start
+    print_timings(f"{count} executables", timings)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--benchmark"]:
+        _benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 30000)
+    else:
+        index = PathIndex().load()
+        for command in ranked(index.names(), Usage(USAGE, RECENCY)):
+            print(command)
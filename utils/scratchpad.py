@@ -0,0 +1,215 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import QtileError
+
+# Seconds after login before the first dropdown is started
+START_DELAY = 5
+# Seconds between starting two dropdowns
+STAGGER = 3
+# How often parked dropdowns are checked against their budget, in seconds
+REAP_INTERVAL = 60
+
+
+class Warm:
+    """Keep a dropdown started in the background and parked until toggled.
+
+    ``budget`` is the resident memory, in MiB, the dropdown's processes may
+    use while parked; above it, the dropdown is closed once it hasn't been
+    shown for ``idle`` seconds. With no budget it stays resident.
+    """
+
+    def __init__(self, budget=None, idle=1800):
+        self.budget = budget
+        self.idle = idle
+
+
+def process_tree_rss(pid):
+    """Return the resident memory of ``pid`` and its descendants, in bytes"""
+    children = defaultdict(list)
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                # The command name may contain spaces, skip past it
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(entry.name))
+    rss = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children[current])
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                rss += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss
+
+
+class WarmPool:
+    """Pre-spawn dropdowns of a scratchpad and reap the expensive idle ones.
+
+    ``start()`` launches the configured dropdowns hidden, one every
+    ``STAGGER`` seconds, so login isn't slowed down. It's safe to call again,
+    and a pool built by a config reload starts on its first ``toggle()`` and
+    takes over from the previous one. Toggling records how long each
+    dropdown took to be mapped, warm or cold, and logs it with the median
+    of ``stats()``.
+
+    Starting dropdowns hidden uses private parts of ``ScratchPad``; where
+    they're missing, dropdowns are started cold when first toggled.
+    """
+
+    # The pool currently running, there's one scratchpad to keep warm
+    running = None
+
+    def __init__(self, scratchpad, dropdowns):
+        self.scratchpad = scratchpad
+        self.dropdowns = dropdowns
+        self.latencies = defaultdict(list)
+        self._shown = {}
+        self._pending = {}
+        self._qtile = None
+        self._timers = []
+
+    def _group(self):
+        return self._qtile.groups_map.get(self.scratchpad)
+
+    def start(self, qtile):
+        self._qtile = qtile
+        previous = WarmPool.running
+        if previous is self:
+            return
+        if previous is not None:
+            previous.stop()
+            self.latencies = previous.latencies
+            self._shown = previous._shown
+        WarmPool.running = self
+        hook.subscribe.client_managed(self._on_managed)
+        for i, name in enumerate(self.dropdowns):
+            self._later(START_DELAY + i * STAGGER, self._spawn_hidden, name)
+        self._later(REAP_INTERVAL, self._reap)
+
+    def stop(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        try:
+            hook.unsubscribe.client_managed(self._on_managed)
+        except QtileError:
+            # A reload already cleared it
+            pass
+        if WarmPool.running is self:
+            WarmPool.running = None
+
+    def _later(self, delay, func, *args):
+        now = asyncio.get_running_loop().time()
+        self._timers = [t for t in self._timers if t.when() > now]
+        self._timers.append(self._qtile.call_later(delay, func, *args))
+
+    def _spawn_hidden(self, name):
+        group = self._group()
+        if group is None or name in group.dropdowns:
+            return
+        if not all(
+            hasattr(group, attr) for attr in ("_dropdownconfig", "_to_hide", "_spawn")
+        ):
+            logger.warning("ScratchPad changed, %s will start when toggled", name)
+            return
+        ddconfig = group._dropdownconfig.get(name)
+        if ddconfig is None:
+            logger.warning("Unknown dropdown to keep warm: %s", name)
+            return
+        # The scratchpad hides windows listed here as soon as they appear
+        group._to_hide.append(name)
+        group._spawn(ddconfig)
+        self._shown[name] = time.monotonic()
+
+    def toggle(self, qtile, name):
+        self.start(qtile)
+        group = self._group()
+        if group is None:
+            logger.warning("No scratchpad group %s", self.scratchpad)
+            return
+        dropdown = group.dropdowns.get(name)
+        to_hide = getattr(group, "_to_hide", [])
+        start = time.perf_counter()
+        if name in to_hide:
+            # Started hidden but not managed yet: show it when it is instead
+            to_hide.remove(name)
+            self._pending[name] = start
+            return
+        group.dropdown_toggle(name)
+        if dropdown is None:
+            # Cold start, finished once the window is managed
+            self._pending[name] = start
+        elif dropdown.visible:
+            self._when_mapped(self._record, name, start, "warm")
+
+    def _on_managed(self, window):
+        group = self._group() if self._qtile else None
+        if group is None:
+            return
+        for name, start in list(self._pending.items()):
+            dropdown = group.dropdowns.get(name)
+            if dropdown is not None and dropdown.window is window:
+                del self._pending[name]
+                self._when_mapped(self._record, name, start, "cold")
+
+    def _when_mapped(self, func, *args):
+        """Call ``func`` once the display server has handled what qtile sent"""
+
+        def sync():
+            conn = getattr(self._qtile.core, "conn", None)
+            if conn is not None:
+                # An X round trip returns after the map has been processed
+                conn.conn.core.GetInputFocus().reply()
+            func(*args)
+
+        # qtile flushes its requests when the current event is handled
+        asyncio.get_running_loop().call_soon(sync)
+
+    def _record(self, name, start, kind):
+        elapsed = time.perf_counter() - start
+        self._shown[name] = time.monotonic()
+        self.latencies[name].append((kind, elapsed))
+        logger.info(
+            "Dropdown %s visible in %.1fms (%s), median %.1fms",
+            name,
+            elapsed * 1e3,
+            kind,
+            self.stats()[f"{name} ({kind})"],
+        )
+
+    def _reap(self):
+        group = self._group()
+        now = time.monotonic()
+        for name, warm in self.dropdowns.items():
+            dropdown = group.dropdowns.get(name) if group else None
+            if warm.budget is None or dropdown is None or dropdown.visible:
+                continue
+            if now - self._shown.get(name, 0) < warm.idle:
+                continue
+            pid = dropdown.window.get_pid()
+            if pid and process_tree_rss(pid) > warm.budget * 1024 * 1024:
+                logger.info("Reaping parked dropdown %s, over its budget", name)
+                dropdown.window.kill()
+        self._later(REAP_INTERVAL, self._reap)
+
+    def stats(self):
+        """Median visible latency per dropdown and start kind, in ms"""
+        stats = {}
+        for name, samples in self.latencies.items():
+            for kind in ("warm", "cold"):
+                times = sorted(t for k, t in samples if k == kind)
+                if times:
+                    stats[f"{name} ({kind})"] = times[len(times) // 2] * 1e3
+        return stats
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from asyncio.subprocess import DEVNULL, PIPE
+from datetime import datetime
+from pathlib import Path
+
+from libqtile.log_utils import logger
+
+from utils.notify import notifier
+
+ICON_DIR = "/usr/share/archcraft/icons/dunst"
+SOUND = "/usr/share/sounds/freedesktop/stereo/screen-capture.oga"
+VIEWER = ["nsxiv", "-b"]
+CLIPBOARD = {
+    "x11": ["xclip", "-selection", "clipboard", "-t", "image/png"],
+    "wayland": ["wl-copy", "--type", "image/png"],
+}
+TAG = "obscreenshot"
+ICON = f"{ICON_DIR}/picture.png"
+
+
+def pictures_dir():
+    """XDG_PICTURES_DIR, read from user-dirs.dirs like xdg-user-dir does"""
+    home = Path.home()
+    config = Path(os.environ.get("XDG_CONFIG_HOME", home / ".config"))
+    try:
+        with open(config / "user-dirs.dirs") as f:
+            for line in f:
+                name, _, value = line.strip().partition("=")
+                if name == "XDG_PICTURES_DIR":
+                    return Path(value.strip('"').replace("$HOME", str(home)))
+    except OSError:
+        pass
+    return home / "Pictures"
+
+
+def screen_geometry(qtile):
+    """Size of the area all screens cover, what xrandr calls current"""
+    width = max(screen.x + screen.width for screen in qtile.screens)
+    height = max(screen.y + screen.height for screen in qtile.screens)
+    return f"{width}x{height}"
+
+
+def window_region(qtile):
+    """flameshot region of the focused window, None without one"""
+    window = qtile.current_window
+    if window is None:
+        return None
+    return f"{window.width}x{window.height}+{window.x}+{window.y}"
+
+
+class Screenshooter:
+    """Take screenshots from inside qtile.
+
+    flameshot captures once into memory. That buffer is handed to the
+    clipboard owner and written to the file at the same time, and the viewer
+    is started without waiting for it. For each shot, the time from the key
+    press, or the end of the countdown, to the image being on the clipboard
+    is logged.
+    """
+
+    def __init__(self, directory=None, viewer=VIEWER, sound=SOUND):
+        self.directory = directory
+        self.viewer = viewer
+        self.sound = sound
+        # (mode, seconds to capture, seconds from capture to clipboard)
+        self.latencies = []
+
+    def shoot(self, qtile, mode="screen", delay=0, operations=()):
+        """Start ``take()`` in the background"""
+        pressed = time.perf_counter()
+        return asyncio.get_running_loop().create_task(
+            self.take(qtile, mode, delay, operations, pressed)
+        )
+
+    async def take(self, qtile, mode="screen", delay=0, operations=(), pressed=None):
+        """Take a screenshot and return the path it was saved to.
+
+        ``mode`` is "screen" for the screen under the pointer, "window" for
+        the focused window and "area" to select one. ``operations`` are
+        applied to the capture by ``utils.imageops.process()``.
+        """
+        if delay:
+            await self._countdown(delay)
+            pressed = None
+        start = pressed if pressed is not None else time.perf_counter()
+        args = {"screen": ["screen"], "area": ["gui"]}.get(mode)
+        if mode == "window":
+            region = window_region(qtile)
+            args = ["gui", "--region", region] if region else ["gui"]
+        data = await self._capture(args)
+        captured = time.perf_counter()
+        if not data:
+            await notifier.send("Screenshot aborted.", icon=ICON, tag=TAG)
+            return None
+
+        if operations:
+            # NumPy and Pillow are only loaded once a capture needs them
+            from utils.imageops import process
+
+            data = await asyncio.to_thread(process, data, operations)
+
+        stamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        directory = Path(self.directory or pictures_dir() / "Screenshots")
+        path = directory / f"Screenshot_{stamp}_{screen_geometry(qtile)}.png"
+        copied, saved = await asyncio.gather(
+            self._copy(qtile.core.name, data, captured),
+            asyncio.to_thread(self._write, path, data),
+        )
+        self.latencies.append((mode, captured - start, copied))
+        logger.info(
+            "Screenshot %s: captured in %.0fms, on the clipboard %.0fms later",
+            mode,
+            (captured - start) * 1e3,
+            copied * 1e3,
+        )
+
+        if self.sound:
+            qtile.spawn(["paplay", self.sound])
+        if saved:
+            await notifier.send("Screenshot saved.", icon=ICON, tag=TAG)
+            if self.viewer:
+                qtile.spawn([*self.viewer, str(path)])
+        return path if saved else None
+
+    async def _countdown(self, seconds):
+        for sec in range(seconds, 0, -1):
+            notifier.notify(
+                f"Taking shot in : {sec}",
+                icon=f"{ICON_DIR}/timer.png",
+                tag="screenshottimer",
+                timeout=1000,
+            )
+            await asyncio.sleep(1)
+        await asyncio.sleep(1)
+
+    @staticmethod
+    async def _capture(args):
+        proc = await asyncio.create_subprocess_exec(
+            "flameshot", *args, "-r", stdout=PIPE, stderr=DEVNULL
+        )
+        data, _ = await proc.communicate()
+        return data if proc.returncode == 0 else b""
+
+    async def _copy(self, backend, data, captured):
+        """Hand the image to the clipboard, return how long that took"""
+        try:
+            # The clipboard tools fork to own the selection once they've read
+            # the image, so it's on the clipboard when they exit
+            proc = await asyncio.create_subprocess_exec(
+                *CLIPBOARD[backend], stdin=PIPE, stdout=DEVNULL, stderr=DEVNULL
+            )
+            await proc.communicate(data)
+        except OSError as e:
+            logger.warning("Could not copy the screenshot: %s", e)
+            return 0
+        elapsed = time.perf_counter() - captured
+        notifier.notify("Copied to clipboard.", icon=ICON, tag=TAG)
+        return elapsed
+
+    @staticmethod
+    def _write(path, data):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        except OSError as e:
+            logger.warning("Could not save the screenshot: %s", e)
+            return False
+        return True
+
+    def stats(self):
+        """Median ms from capture to clipboard per mode"""
+        stats = {}
+        for mode in {mode for mode, _, _ in self.latencies}:
+            times = sorted(c for m, _, c in self.latencies if m == mode)
+            stats[mode] = times[len(times) // 2] * 1e3
+        return stats
+
+
+screenshooter = Screenshooter()
@@ -0,0 +1,146 @@
+"""Settings of the screenshot tools, from ~/.config/dmenu_shot/config.toml.
+
+Tables are flattened into names joined with underscores, so both
+
+    [action.bordered]
+    line_color = "#81A1C1"
+
+and ``[action]`` with ``bordered_line_color`` give
+``action_bordered_line_color``. The settings merged over the defaults are
+cached in ~/.cache/dmenu_shot, keyed on the config's path, mtime and size
+and on the defaults, and an unchanged config is never parsed again. A
+config that isn't valid TOML gives the defaults, with a warning.
+
+Run as a script, it prints the settings as shell variables prefixed with
+``config_``, for dmenu_screenshot to eval.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+DEFAULTS = {
+    "action_bordered_line_color": "#81A1C1",
+    "action_bordered_line_thickness": 2,
+    "action_bordered_corner_radius": 1,
+}
+# Part of the cache key, so that changing a default invalidates the cache
+DEFAULTS_HASH = hashlib.sha1(json.dumps(DEFAULTS, sort_keys=True).encode()).hexdigest()
+CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "dmenu_shot",
+    "config.json",
+)
+
+# Settings loaded by this process, by config path
+_loaded = {}
+
+
+def config_path():
+    return os.environ.get(
+        "DMENU_SHOT_CONF_PATH", os.path.expanduser("~/.config/dmenu_shot/config.toml")
+    )
+
+
+def flatten(table, prefix=""):
+    flat = {}
+    for key, value in table.items():
+        name = f"{prefix}_{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _read_cache(cache, key):
+    try:
+        with open(cache) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry["settings"] if entry.get("key") == key else None
+
+
+def _write_cache(cache, key, settings):
+    tmp = f"{cache}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump({"key": key, "settings": settings}, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+
+
+def load(path=None, cache=CACHE):
+    """Return the settings, the defaults if there is no config"""
+    path = path or config_path()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return dict(DEFAULTS)
+    key = [path, stat.st_mtime_ns, stat.st_size, DEFAULTS_HASH]
+    loaded = _loaded.get(path)
+    if loaded is not None and loaded[0] == key:
+        return loaded[1]
+    settings = _read_cache(cache, key)
+    if settings is None:
+        # Only needed when the config changed, keep it off the startup path
+        import tomllib
+
+        try:
+            with open(path, "rb") as f:
+                settings = {**DEFAULTS, **flatten(tomllib.load(f))}
+        except (tomllib.TOMLDecodeError, OSError) as e:
+            # Like an unquoted colour, which the old parser let through
+            print(f"{path}: {e}, using the defaults", file=sys.stderr)
+            return dict(DEFAULTS)
+        _write_cache(cache, key, settings)
+    _loaded[path] = (key, settings)
+    return settings
+
+
+def shell_variables(settings):
+    return "\n".join(
+        f"config_{name}={shlex.quote(str(value))}"
+        for name, value in settings.items()
+        if name.isidentifier()
+    )
+
+
+def _benchmark(path):
+    """Time loading the config cold, from the disk cache and in process"""
+    cache = f"{CACHE}.benchmark"
+    timings = {}
+    for label in ("parsed", "disk cache", "in process"):
+        if label != "in process":
+            _loaded.clear()
+        if label == "parsed":
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(cache)
+        start = time.perf_counter()
+        load(path, cache)
+        timings[label] = (time.perf_counter() - start) * 1e3
+    # Nothing is cached for a missing or invalid config
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(cache)
+
+    # What dmenu_screenshot pays at startup, interpreter included
+    start = time.perf_counter()
+    subprocess.run([sys.executable, __file__, path], capture_output=True, check=True)
+    timings["script"] = (time.perf_counter() - start) * 1e3
+    print(", ".join(f"{label} {ms:.2f}ms" for label, ms in timings.items()))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--benchmark"]:
+        _benchmark(args[1] if len(args) > 1 else config_path())
+    else:
+        print(shell_variables(load(args[0] if args else None)))
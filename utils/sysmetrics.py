@@ -0,0 +1,202 @@
+import asyncio
+import time
+from collections import deque, namedtuple
+
+PROC_STAT = "/proc/stat"
+PROC_MEMINFO = "/proc/meminfo"
+PROC_NET_DEV = "/proc/net/dev"
+HISTORY = 120
+
+Sample = namedtuple("Sample", ["time", "cpu_busy", "cpu_total", "mem", "net"])
+
+
+def parse_stat(data):
+    """Return busy and total jiffies from the aggregate cpu line"""
+    fields = data[: data.index(b"\n")].split()[1:]
+    values = [int(field) for field in fields]
+    # guest and guest_nice are already accounted for in user and nice
+    total = sum(values[:8])
+    idle = values[3] + values[4]
+    return total - idle, total
+
+
+def parse_meminfo(data):
+    """Return meminfo fields in bytes"""
+    mem = {}
+    for line in data.splitlines():
+        key, _, value = line.partition(b":")
+        mem[key.decode()] = int(value.split()[0]) * 1024
+    return mem
+
+
+def parse_net_dev(data):
+    """Return ``{interface: (received, sent)}`` in bytes"""
+    net = {}
+    for line in data.splitlines()[2:]:
+        iface, _, counters = line.partition(b":")
+        fields = counters.split()
+        net[iface.strip().decode()] = (int(fields[0]), int(fields[8]))
+    return net
+
+
+class Sampler:
+    """Read CPU, memory and network counters from /proc in one pass.
+
+    The files are kept open and re-read from the start on every sample. The
+    last ``history`` samples are kept, so rates and averages over any window
+    they cover need no extra reads. Subscribers are called at their own
+    intervals from a single timer, all sharing the most recent sample.
+    """
+
+    def __init__(self, history=HISTORY):
+        self.history = deque(maxlen=history)
+        self._files = None
+        self._subscribers = {}
+        self._handle = None
+
+    def _open(self):
+        self._files = [
+            open(name, "rb", buffering=0)
+            for name in (PROC_STAT, PROC_MEMINFO, PROC_NET_DEV)
+        ]
+
+    def close(self):
+        for f in self._files or ():
+            f.close()
+        self._files = None
+
+    def _read(self, f):
+        f.seek(0)
+        chunks = []
+        while chunk := f.read(65536):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def sample(self):
+        if self._files is None:
+            self._open()
+        stat, meminfo, net_dev = (self._read(f) for f in self._files)
+        busy, total = parse_stat(stat)
+        sample = Sample(
+            time.monotonic(),
+            busy,
+            total,
+            parse_meminfo(meminfo),
+            parse_net_dev(net_dev),
+        )
+        self.history.append(sample)
+        return sample
+
+    @property
+    def latest(self):
+        return self.history[-1] if self.history else self.sample()
+
+    def _since(self, window):
+        """Return the newest earlier sample at least ``window`` seconds old"""
+        latest = self.latest
+        for i in range(len(self.history) - 2, -1, -1):
+            if latest.time - self.history[i].time >= window:
+                return self.history[i]
+        return self.history[0]
+
+    def cpu_percent(self, window=0):
+        latest = self.latest
+        old = self._since(window)
+        total = latest.cpu_total - old.cpu_total
+        if total <= 0:
+            return 0.0
+        return (latest.cpu_busy - old.cpu_busy) / total * 100
+
+    def net_rates(self, interface=None, window=0):
+        """Return received and sent bytes per second, for all interfaces if
+        ``interface`` is None"""
+        latest = self.latest
+        old = self._since(window)
+        elapsed = latest.time - old.time
+        if elapsed <= 0:
+            return 0.0, 0.0
+        names = [interface] if interface else latest.net.keys()
+        received = sent = 0
+        for name in names:
+            if name in latest.net and name in old.net:
+                received += latest.net[name][0] - old.net[name][0]
+                sent += latest.net[name][1] - old.net[name][1]
+        return received / elapsed, sent / elapsed
+
+    def subscribe(self, callback, interval):
+        """Call ``callback()`` every ``interval`` seconds with a fresh sample"""
+        self._subscribers[callback] = [interval, 0]
+        self._reschedule()
+
+    def unsubscribe(self, callback):
+        self._subscribers.pop(callback, None)
+        if not self._subscribers:
+            self._cancel()
+            self.close()
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _reschedule(self):
+        self._cancel()
+        self._handle = asyncio.get_running_loop().call_soon(self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        due = [
+            (callback, entry)
+            for callback, entry in self._subscribers.items()
+            if entry[1] <= now
+        ]
+        if due:
+            self.sample()
+            for callback, entry in due:
+                entry[1] = now + entry[0]
+                callback()
+        if self._subscribers:
+            wake = min(entry[1] for entry in self._subscribers.values())
+            self._handle = asyncio.get_running_loop().call_later(
+                max(wake - time.monotonic(), 0), self._tick
+            )
+        else:
+            self._handle = None
+
+
+sampler = Sampler()
+
+
+def _timeit(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds
+
+
+def _reopen():
+    for name in (PROC_STAT, PROC_MEMINFO, PROC_NET_DEV):
+        with open(name, "rb") as f:
+            f.read()
+
+
+def _benchmark(rounds):
+    shared = Sampler()
+    shared.sample()
+    results = {
+        "sample (read + parse)": _timeit(shared.sample, rounds),
+        "read, files kept open": _timeit(
+            lambda: [shared._read(f) for f in shared._files], rounds
+        ),
+        "read, files reopened": _timeit(_reopen, rounds),
+        "cpu and net rates from history": _timeit(
+            lambda: (shared.cpu_percent(5), shared.net_rates(window=5)), rounds
+        ),
+    }
+    shared.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, cost in _benchmark(5000).items():
+        print(f"{name}: {cost * 1e6:.1f}us")
@@ -0,0 +1,365 @@
+"""Ranked bookmarks and history for dmenu_websearch.
+
+Bookmarks from ~/.bookmarks and the dmenu history of past choices are kept
+in an index under ~/.cache/dmenu_websearch. Entries are ranked by how often
+and how recently they were chosen, with bookmarks ahead of one-off history.
+The index is rebuilt only when a source changes, and only the new lines are
+read when the history has been appended to. Every entry is handed to dmenu,
+best first, and dmenu does the filtering.
+
+Run as a script:
+
+    websearch.py candidates           every entry, best first
+    websearch.py resolve CHOICE       the URL to open for a choice
+    websearch.py update               bring the index up to date
+
+Inside qtile, ``launch()`` starts dmenu_websearch with the focused window
+already looked up, instead of the script asking X for it.
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from urllib.parse import quote
+
+BOOKMARKS = os.path.expanduser("~/.bookmarks")
+HISTORY = os.path.expanduser("~/.dmenu/dmenu_websearch")
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "dmenu_websearch",
+)
+ENGINE = "https://duckduckgo.com/?q=%s"
+# History lines after which a choice counts half as much
+RECENCY = 200
+BOOKMARK_WEIGHT = 2.0
+PROTOCOL_RE = re.compile(r"^(https?|ftps?|mailto|about|file):///?", re.IGNORECASE)
+HOST_RE = re.compile(r"^([\w~:-]+\.?){1,3}")
+# Bytes before the end of the history that must be unchanged to read on
+TAIL = 64
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class Index:
+    """Bookmarks and history entries with their use counts.
+
+    Each entry is ``[count, last, bookmark]``: how often it was chosen, the
+    history line it was last chosen on and whether it's a bookmark. A
+    choice counts half once RECENCY more lines of history follow it.
+    """
+
+    def __init__(self, bookmarks=BOOKMARKS, history=HISTORY, cache_dir=CACHE_DIR):
+        self.bookmarks = bookmarks
+        self.history = history
+        self.cache_dir = cache_dir
+        self.entries = None
+        self.lines = 0
+        self.offset = 0
+        self.tail = ""
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _sources(self):
+        return {"bookmarks": _stat(self.bookmarks), "history": _stat(self.history)}
+
+    def fresh(self):
+        """True if the cached ranking matches the sources"""
+        try:
+            with open(self._path("state.json")) as f:
+                return json.load(f)["sources"] == self._sources()
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def load(self):
+        """Load the index, bringing it up to date with the sources"""
+        sources = self._sources()
+        try:
+            with open(self._path("index.json")) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {"sources": {}}
+        self.entries = saved.get("entries", {})
+        self.lines = saved.get("lines", 0)
+        self.offset = saved.get("offset", 0)
+        self.tail = saved.get("tail", "")
+        if saved["sources"] == sources:
+            return self
+        if saved["sources"].get("bookmarks") != sources["bookmarks"]:
+            self._read_bookmarks()
+        if saved["sources"].get("history") != sources["history"]:
+            self._read_history()
+        self._save(sources)
+        return self
+
+    def _read_bookmarks(self):
+        for entry in self.entries.values():
+            entry[2] = False
+        try:
+            with open(self.bookmarks, errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        self.entries.setdefault(line, [0, 0, False])[2] = True
+        except OSError:
+            pass
+        self._drop_unused()
+
+    def _read_history(self):
+        try:
+            f = open(self.history, "rb")
+        except OSError:
+            f = None
+        with f or open(os.devnull, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            appended = TAIL <= self.offset <= size
+            if appended:
+                f.seek(self.offset - TAIL)
+                appended = f.read(TAIL).decode(errors="replace") == self.tail
+            if not appended:
+                # Rewritten, not just appended to: count everything again
+                for entry in self.entries.values():
+                    entry[0] = entry[1] = 0
+                self.lines = 0
+                f.seek(0)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # Still being written, read it next time
+                    break
+                self.offset = f.tell()
+                line = raw.decode(errors="replace").strip()
+                if not line:
+                    continue
+                self.lines += 1
+                entry = self.entries.setdefault(line, [0, 0, False])
+                entry[0] += 1
+                entry[1] = self.lines
+            if not appended or self.offset > size:
+                self.offset = min(self.offset, f.tell())
+            f.seek(max(self.offset - TAIL, 0))
+            self.tail = f.read(min(TAIL, self.offset)).decode(errors="replace")
+        self._drop_unused()
+
+    def _drop_unused(self):
+        unused = [
+            text
+            for text, (count, _, bookmark) in self.entries.items()
+            if not count and not bookmark
+        ]
+        for text in unused:
+            del self.entries[text]
+
+    def ranked(self):
+        """Every entry, best first"""
+        lines = self.lines
+        scored = [
+            (
+                count / (1 + (lines - last) / RECENCY)
+                + (BOOKMARK_WEIGHT if bookmark else 0),
+                text,
+            )
+            for text, (count, last, bookmark) in self.entries.items()
+        ]
+        return [text for _, text in sorted(scored, reverse=True)]
+
+    def _save(self, sources):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        saved = {
+            "sources": sources,
+            "entries": self.entries,
+            "lines": self.lines,
+            "offset": self.offset,
+            "tail": self.tail,
+        }
+        ranked = self.ranked()
+        for name, write in (
+            # dumps() encodes in C, dump() to a file doesn't
+            ("index.json", lambda f: f.write(json.dumps(saved))),
+            ("ranked.txt", lambda f: f.write("".join(t + "\n" for t in ranked))),
+            # Last, it marks the other two as current
+            ("state.json", lambda f: json.dump({"sources": sources}, f)),
+        ):
+            tmp = self._path(f"{name}.{os.getpid()}")
+            with open(tmp, "w") as f:
+                write(f)
+            os.replace(tmp, self._path(name))
+
+    def candidates(self, out):
+        """Write every entry to ``out``, best first"""
+        if self.entries is None and not self.fresh():
+            self.load()
+        try:
+            with open(self._path("ranked.txt")) as f:
+                shutil.copyfileobj(f, out)
+        except OSError:
+            pass
+
+    def is_bookmark(self, text):
+        """Whether ``text`` is a line of the bookmarks file.
+
+        Read from the file itself, the index isn't needed to open a choice.
+        """
+        try:
+            with open(self.bookmarks, errors="replace") as f:
+                return any(line.strip() == text for line in f)
+        except OSError:
+            return False
+
+
+def is_url(choice):
+    """Whether a choice is an address rather than a search"""
+    if PROTOCOL_RE.match(choice):
+        return True
+    if len(choice) < 4 or " " in choice or ".." in choice:
+        return False
+    host = re.split(r"[/#?]", choice, 1)[0]
+    return "." in host and HOST_RE.match(host) is not None
+
+
+def resolve(choice, index=None, engine=ENGINE):
+    """Return the URL to open for what was chosen in dmenu"""
+    choice = choice.strip()
+    index = index or Index()
+    if index.is_bookmark(choice):
+        # Bookmarks are a URL followed by a description
+        choice = choice.split()[0]
+    elif not is_url(choice):
+        return engine.replace("%s", quote(choice, safe=""))
+    return choice if PROTOCOL_RE.match(choice) else "http://" + choice
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return []
+    # Kernels without CONFIG_PROC_CHILDREN
+    children = []
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit() and _proc_stat(entry.name)[0] == pid:
+            children.append(int(entry.name))
+    return children
+
+
+def _proc_stat(pid):
+    """Parent and start time of a process"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The name can contain spaces and parentheses, skip past it
+            fields = f.read().rpartition(")")[2].split()
+    except OSError:
+        return None, 0
+    return int(fields[1]), int(fields[19])
+
+
+def deepest_process(pid):
+    """Follow the oldest child down, like a ``pgrep -oP`` loop"""
+    while children := _children(pid):
+        pid = min(children, key=lambda child: _proc_stat(child)[1])
+    return pid
+
+
+def process_name(pid):
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def focused_window(qtile):
+    """The focused window's id, class and pid, and its deepest process.
+
+    The process is what runs inside a terminal, to find text browsers.
+    """
+    window = qtile.current_window
+    if window is None:
+        return None
+    wm_class = window.get_wm_class() or [""]
+    pid = window.get_pid()
+    process = deepest_process(pid) if pid else None
+    return {
+        "wid": window.wid,
+        "wm_class": wm_class[-1],
+        "pid": pid,
+        "process": process_name(process) if process else "",
+    }
+
+
+def launch(qtile, script, *args):
+    """Start dmenu_websearch with what it needs to know of the focused window"""
+    env = {"WEBSEARCH_WINDOW": "", "WEBSEARCH_CLASS": "", "WEBSEARCH_PROCESS": ""}
+    window = focused_window(qtile)
+    if window is not None:
+        env["WEBSEARCH_CLASS"] = window["wm_class"]
+        env["WEBSEARCH_PROCESS"] = window["process"]
+        # Only X windows can be typed into or have properties read
+        if qtile.core.name == "x11":
+            env["WEBSEARCH_WINDOW"] = str(window["wid"])
+    qtile.spawn([script, *args], env=env)
+
+
+def _benchmark(count):
+    """Build, rank and query an index of ``count`` bookmarks and history lines"""
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    words = [f"{a}{b}" for a in "bcdfgklmnprst" for b in ("ash", "ore", "ine", "ux")]
+    with tempfile.TemporaryDirectory() as tmp:
+        bookmarks = os.path.join(tmp, "bookmarks")
+        history = os.path.join(tmp, "history")
+        with open(bookmarks, "w") as f:
+            for i in range(count):
+                f.write(f"https://{rng.choice(words)}{i}.org/{rng.choice(words)} ")
+                f.write(" ".join(rng.choices(words, k=3)) + "\n")
+        with open(history, "w") as f:
+            for _ in range(count):
+                f.write(" ".join(rng.choices(words, k=rng.randint(1, 3))) + "\n")
+        cache = os.path.join(tmp, "cache")
+        timings = {}
+        start = time.perf_counter()
+        Index(bookmarks, history, cache).load()
+        timings["build"] = time.perf_counter() - start
+        with open(history, "a") as f:
+            f.write("one more search\n")
+        start = time.perf_counter()
+        Index(bookmarks, history, cache).load()
+        timings["append"] = time.perf_counter() - start
+        with open(os.devnull, "w") as out:
+            start = time.perf_counter()
+            Index(bookmarks, history, cache).candidates(out)
+            timings["candidates"] = time.perf_counter() - start
+        index = Index(bookmarks, history, cache)
+        start = time.perf_counter()
+        resolve("kine3.org/path", index)
+        timings["resolve"] = time.perf_counter() - start
+    print(
+        f"{count} bookmarks and history lines: "
+        + ", ".join(f"{name} {t * 1e3:.2f}ms" for name, t in timings.items())
+    )
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:] or ["candidates"]
+    if command == "--benchmark":
+        _benchmark(int(args[0]) if args else 20000)
+    elif command == "candidates":
+        Index().candidates(sys.stdout)
+    elif command == "update":
+        Index().load()
+    elif command == "resolve":
+        engine = os.environ.get("WEBSEARCH_ENGINE", ENGINE)
+        print(resolve(" ".join(args), engine=engine))